@@ -0,0 +1,186 @@
+# the admin channel: a local socket (a named pipe on windows) the running server listens on, so the CLI can run its commands
+# inside the server instead of opening project.db itself. every command from every attached console runs there one at a time,
+# is saved as soon as it finishes, and shows up on the website straight away.
+# messages are python tuples sent over multiprocessing.connection, which also checks a secret key (instance/admin.key)
+# so only someone who can read the instance folder can attach.
+#   console -> server: ("run", line), ("answer", text)
+#   server -> console: ("print", text), ("ask", prompt), ("done", None), ("error", message)
+# this file is imported by the CLI before it knows whether there's a server, so flask & co are only imported where they're used
+from multiprocessing.connection import Client, Listener, Connection
+from multiprocessing import AuthenticationError
+from threading import Event, Lock, Thread
+import atexit
+import hashlib
+import io
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+ADMIN_KEY_FILE = "admin.key"
+ADMIN_WAIT_SECONDS = 15 # how long a CLI started next to the server waits for it to start listening
+
+# where the instance folder is, same as flask works it out for the website and the CLI
+def instancePath() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+
+def adminAddress(instanceFolder: str) -> tuple[str, str]:
+    tag = hashlib.sha1(instanceFolder.encode()).hexdigest()[:12]
+    if sys.platform == "win32":
+        return "AF_PIPE", rf"\\.\pipe\catalogue-admin-{tag}"
+    path = os.path.join(instanceFolder, "admin.sock")
+    if len(path) > 100: # unix socket paths cant be much longer than this
+        path = os.path.join(tempfile.gettempdir(), f"catalogue-admin-{tag}.sock")
+    return "AF_UNIX", path
+
+# --- server side ---
+
+# one command at a time, from every console. writes happen in one place, and output/questions go to the right console
+adminLock = Lock()
+
+# cli.output while a console's command runs, what the command prints is sent to that console
+class ConsoleOutput(io.TextIOBase):
+    def __init__(self, conn: Connection):
+        self.conn = conn
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self.conn.send(("print", text))
+        return len(text)
+
+def askConsole(conn: Connection, prompt: str) -> str:
+    conn.send(("ask", prompt))
+    kind, answer = conn.recv()
+    return answer if kind == "answer" else ""
+
+def serveConsole(app, conn: Connection):
+    import cli
+    from models import db
+    with conn, app.app_context():
+        while True:
+            try:
+                kind, line = conn.recv()
+            except (EOFError, OSError):
+                return
+            if kind != "run":
+                continue
+            with adminLock:
+                cli.askUser = lambda prompt: askConsole(conn, prompt)
+                cli.output = ConsoleOutput(conn)
+                try:
+                    cli.runConsoleLine(line)
+                    db.session.commit()
+                    reply = ("done", None)
+                except Exception as e:
+                    db.session.rollback()
+                    reply = ("error", str(e))
+                finally:
+                    cli.askUser = input
+                    cli.output = None
+                # let this process's live counts catch up now instead of at the next poll
+                if "availability" in app.extensions:
+                    app.extensions["availability"].poke()
+            try:
+                conn.send(reply)
+            except OSError:
+                return # the console went away mid-command
+
+def acceptConsoles(app, listener: Listener, stopped: Event):
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError, AuthenticationError):
+            if stopped.is_set():
+                return
+            continue # wrong key, or someone who hung up straight away
+        Thread(target=serveConsole, args=(app, conn), name="catalogue-admin-console", daemon=True).start()
+
+# starts listening for consoles, in the process that runs the website (gunicorn's main process when serving)
+def startAdmin(app):
+    if not app.config.setdefault("ADMIN_CHANNEL", True):
+        return
+    try:
+        connectAdmin(app.instance_path).close()
+        app.logger.warning("another server already has the admin channel, consoles will attach to that one")
+        return
+    except OSError:
+        pass
+    family, address = adminAddress(app.instance_path)
+    if family == "AF_UNIX" and os.path.exists(address):
+        os.remove(address) # left over from a server that didnt shut down cleanly
+    keyPath = os.path.join(app.instance_path, ADMIN_KEY_FILE)
+    authkey = secrets.token_bytes(32)
+    os.makedirs(app.instance_path, exist_ok=True)
+    # only readable by whoever runs the server
+    with os.fdopen(os.open(keyPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as keyFile:
+        keyFile.write(authkey)
+    listener = Listener(address, family, authkey=authkey)
+    stopped = Event()
+    pid = os.getpid()
+    def cleanUp():
+        if os.getpid() == pid: # gunicorn's workers run atexit too, only the process that listens should clean up
+            stopped.set()
+            listener.close()
+            if os.path.exists(keyPath):
+                os.remove(keyPath)
+    atexit.register(cleanUp)
+    Thread(target=acceptConsoles, args=(app, listener, stopped), name="catalogue-admin", daemon=True).start()
+
+# --- console side ---
+
+# connects to the running server, raises OSError if there isnt one
+def connectAdmin(instanceFolder: str | None = None) -> Connection:
+    folder = instanceFolder or instancePath()
+    family, address = adminAddress(folder)
+    with open(os.path.join(folder, ADMIN_KEY_FILE), "rb") as keyFile:
+        authkey = keyFile.read()
+    try:
+        return Client(address, family, authkey=authkey)
+    except (AuthenticationError, EOFError) as e: # an old key, or a server that's shutting down
+        raise OSError(f"couldn't attach to the server: {e}") from e
+
+# the server started next to this CLI (if there is one) takes a moment before it listens. 
+# None if there's no server to attach to
+def attachToServer(server) -> Connection | None:
+    deadline = time.monotonic() + (ADMIN_WAIT_SECONDS if server is not None else 0)
+    while True:
+        try:
+            return connectAdmin()
+        except OSError:
+            if time.monotonic() >= deadline or not server.is_alive():
+                return None
+            time.sleep(0.2)
+
+# runs one command on the server, printing what it prints and answering its questions from this terminal
+def runRemote(conn: Connection, line: str):
+    conn.send(("run", line))
+    while True:
+        kind, value = conn.recv()
+        if kind == "print":
+            sys.stdout.write(value)
+        elif kind == "ask":
+            conn.send(("answer", input(value)))
+        elif kind == "error":
+            raise Exception(value)
+        else:
+            sys.stdout.flush()
+            return
+
+# the CLI attached to the server, returns when the user quits
+def runConsole(conn: Connection):
+    print("attached to the running server, every command is saved as soon as it finishes")
+    with conn:
+        while True:
+            userInput = input(" CATA > ").strip()
+            if userInput.lower() == "quit":
+                return
+            try:
+                runRemote(conn, userInput)
+            except (EOFError, OSError):
+                print("lost the connection to the server, start the CLI again to keep going")
+                return
+            except Exception as e:
+                print(f"something went wrong, please check your command in the help menu\nnothing was saved\n{e}\n")
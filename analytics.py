@@ -0,0 +1,130 @@
+# demand analytics: what gets booked and when, what people keep asking for, and what's running out.
+# everything here reads the rollup tables that triggers keep up to date (see "demand rollups" in models.py),
+# never the bookings themselves, so the page costs the same with years of bookings as with a week of them
+from flask import Flask, jsonify, render_template, request
+from datetime import date, timedelta
+import time
+
+from models import db, Entry, BookingDaily, BookingDayTotal, BookingTotal, RequestDemand, SECONDS_PER_DAY
+
+ANALYTICS_DAYS = 90 # how far back the timeline and "recently booked" go by default
+MAX_ANALYTICS_DAYS = 3660
+TOP_ROWS = 10 # rows in each of the top lists
+MAX_TOP_ROWS = 100
+
+# days since 1970 (UTC), what booking_daily.day counts in
+def today() -> int:
+    return int(time.time()) // SECONDS_PER_DAY
+
+def dayText(day: int) -> str:
+    return "undated" if day == 0 else (date(1970, 1, 1) + timedelta(days=day)).isoformat()
+
+# bookings per day for the last `days` days, oldest first, days without bookings included as 0.
+# every material added together, or just the one given
+def bookingTimeline(days: int, material: str | None = None) -> list[dict]:
+    last = today()
+    first = last - days + 1
+    if material is None:
+        query = db.select(BookingDayTotal.day, BookingDayTotal.bookings).where(BookingDayTotal.day >= first)
+    else:
+        query = db.select(BookingDaily.day, BookingDaily.bookings).where(BookingDaily.material == material, BookingDaily.day >= first)
+    counts = dict(db.session.execute(query).all())
+    return [{"day": dayText(day), "bookings": counts.get(day, 0)} for day in range(first, last + 1)]
+
+# most booked materials, all time (days=None) or over the last `days` days
+def topBooked(limit: int, days: int | None = None) -> list[dict]:
+    if days is None:
+        query = db.select(BookingTotal.material, BookingTotal.bookings, BookingTotal.lastDay).order_by(BookingTotal.bookings.desc(), BookingTotal.material)
+    else:
+        # left to itself sqlite groups by walking every day of every material in primary key order, so the page would 
+        # get slower with every year of history. reading the window in day order first keeps it to the days asked for
+        window = (db.select(BookingDaily.material, BookingDaily.bookings, BookingDaily.day).where(BookingDaily.day > today() - days)
+                  .order_by(BookingDaily.day).subquery())
+        bookings = db.func.sum(window.c.bookings)
+        query = db.select(window.c.material, bookings, db.func.max(window.c.day)).group_by(window.c.material).order_by(bookings.desc(), window.c.material)
+    return [{"material": material, "bookings": count, "lastBooked": dayText(lastDay)} for material, count, lastDay in db.session.execute(query.limit(limit))]
+
+# most asked for requests, ties go to whichever was asked for most recently
+def topRequested(limit: int) -> list[dict]:
+    query = db.select(RequestDemand).order_by(RequestDemand.asks.desc(), RequestDemand.lastAskedAt.desc()).limit(limit)
+    return [{"material": row.material, "asks": row.asks, "lastAsked": dayText(row.lastAskedAt // SECONDS_PER_DAY)} for row in db.session.execute(query).scalars()]
+
+# entries with the most bookings for what's there, booked / available.
+# these are the live counters on entry, so they're already up to date without a rollup of their own.
+# entries with bookings and nothing available come first, their ratio is None
+def bookingRatios(limit: int) -> list[dict]:
+    nothingLeft = db.case((Entry.available <= 0, 1), else_=0)
+    ratio = db.cast(Entry.booked, db.Float) / db.case((Entry.available > 0, Entry.available), else_=1)
+    query = (db.select(Entry.name, Entry.booked, Entry.available).where(Entry.booked > 0)
+             .order_by(nothingLeft.desc(), ratio.desc(), Entry.name).limit(limit))
+    return [
+        {"material": name, "booked": booked, "available": available, "ratio": round(booked / available, 3) if available > 0 else None}
+        for name, booked, available in db.session.execute(query)
+    ]
+
+def analyticsSummary(days: int, top: int) -> dict:
+    return {
+        "days": days,
+        "timeline": bookingTimeline(days),
+        "topBooked": topBooked(top, days),
+        "topBookedAllTime": topBooked(top),
+        "topRequested": topRequested(top),
+        "ratios": bookingRatios(top),
+    }
+
+# one material: its all-time total and its own timeline
+def materialSummary(material: str, days: int) -> dict:
+    total = db.session.execute(db.select(BookingTotal.bookings, BookingTotal.lastDay).where(BookingTotal.material == material)).first()
+    asks = db.session.execute(db.select(RequestDemand.asks).where(RequestDemand.material == material)).scalar()
+    return {
+        "material": material,
+        "days": days,
+        "bookings": total[0] if total else 0,
+        "lastBooked": dayText(total[1]) if total else None,
+        "asks": asks or 0,
+        "timeline": bookingTimeline(days, material),
+    }
+
+# days and top from the query string, kept inside their limits. raises ValueError if they arent numbers
+def windowArgs() -> tuple[int, int]:
+    days = min(max(int(request.args.get("days", ANALYTICS_DAYS)), 1), MAX_ANALYTICS_DAYS)
+    top = min(max(int(request.args.get("top", TOP_ROWS)), 1), MAX_TOP_ROWS)
+    return days, top
+
+# --- routes ---
+
+# GET /analytics?days=<window>&top=<rows>&material=<name>
+def analyticsPage():
+    try:
+        days, top = windowArgs()
+    except ValueError:
+        days, top = ANALYTICS_DAYS, TOP_ROWS
+    material = request.args.get("material") or None
+    return render_template("analyticsTemplate.html", summary=analyticsSummary(days, top),
+                           material=materialSummary(material, days) if material else None)
+
+# GET /api/analytics?days=<window>&top=<rows>
+def analyticsAPI():
+    try:
+        days, top = windowArgs()
+    except ValueError:
+        return jsonify({"error": "days and top should be numbers"}), 400
+    return jsonify(analyticsSummary(days, top))
+
+# GET /api/analytics/material?name=<material>&days=<window>
+# a query parameter instead of part of the path, material names can have slashes in them
+def materialAPI():
+    material = request.args.get("name", "")
+    if not material:
+        return jsonify({"error": "which material? (?name=...)"}), 400
+    try:
+        days, _ = windowArgs()
+    except ValueError:
+        return jsonify({"error": "days should be a number"}), 400
+    return jsonify(materialSummary(material, days))
+
+# not behind the page cache: the timeline moves on at midnight without any table changing
+def initAnalytics(app: Flask):
+    app.add_url_rule("/analytics", "analytics", analyticsPage)
+    app.add_url_rule("/api/analytics", "analyticsAPI", analyticsAPI)
+    app.add_url_rule("/api/analytics/material", "materialAnalytics", materialAPI)
@@ -0,0 +1,55 @@
+# moving old bookings out of the live booking table into booking_archive, used by the CLI's 'archive' and
+# 'python main.py archive' (run that from cron or task scheduler to keep it going by itself).
+# booking only grows otherwise, and the bookings page, searches and the CLI all slow down a bit more every term.
+# archived bookings arent gone, they can still be searched, viewed and exported, they just have to be asked for
+import time
+from typing import TextIO
+from sqlalchemy import or_
+
+from models import db, Entry, Booking, BookingArchive
+
+ARCHIVE_AFTER_DAYS = 180 # bookings older than this are archived by default, about a school term and a half
+ARCHIVE_BATCH_SIZE = 2000 # bookings moved per transaction
+
+# moves the bookings in ids into the archive, in the current transaction.
+# an archived booking is over, so the booked counts on their entries go down like removing them by hand would.
+# the analytics rollups still remember them
+def archiveBatch(ids: list[int], archivedAt: int):
+    counts = db.session.execute(
+        db.select(Booking.entryId, db.func.count()).where(Booking.id.in_(ids), Booking.entryId.is_not(None)).group_by(Booking.entryId)
+    ).all()
+    # one executemany instead of an UPDATE per entry, a batch can touch most of the catalogue
+    entry = Entry.__table__
+    if counts:
+        db.session.connection().execute(entry.update().where(entry.c.id == db.bindparam("entryId")).values(booked=entry.c.booked - db.bindparam("count")),
+                                        [{"entryId": entryId, "count": count} for entryId, count in counts])
+    rows = db.select(Booking.id, Booking.entryId, Booking.bookedMaterial, Booking.bookedBy, Booking.bookInfo, Booking.bookedAt, db.literal(archivedAt))
+    db.session.execute(db.insert(BookingArchive).from_select(
+        ["bookingId", "entryId", "bookedMaterial", "bookedBy", "bookInfo", "bookedAt", "archivedAt"], rows.where(Booking.id.in_(ids))
+    ))
+    db.session.execute(db.delete(Booking).where(Booking.id.in_(ids)), execution_options={"synchronize_session": False})
+
+# moves bookings made before `before` (unix time), and undated ones from before bookedAt existed, into the archive.
+# each batch is its own transaction unless commit is False, so stopping halfway leaves every booking in exactly one of the tables.
+# progress is printed to out (the terminal if None). returns how many were moved
+def archiveBookings(before: int, material: str | None = None, batchSize: int = ARCHIVE_BATCH_SIZE, commit: bool = True, out: TextIO | None = None) -> int:
+    started = time.perf_counter()
+    query = db.select(Booking.id).where(or_(Booking.bookedAt < before, Booking.bookedAt.is_(None))).order_by(Booking.id).limit(batchSize)
+    if material is not None:
+        query = query.where(Booking.bookedMaterial == material)
+    moved = 0
+    while ids := db.session.execute(query).scalars().all():
+        archiveBatch(ids, int(time.time()))
+        if commit:
+            db.session.commit()
+        moved += len(ids)
+        print(f"  archived {moved} bookings so far", end="\r", file=out)
+    seconds = time.perf_counter() - started
+    print(f"archived {moved} bookings in {seconds:.2f}s ({moved / max(seconds, 1e-9):.0f} rows/sec)\n", file=out)
+    return moved
+
+# how far back "old" goes, from --before YYYY-MM-DD (local time) or --days n
+def archiveCutoff(before: str | None = None, days: str | int | None = None) -> int:
+    if before:
+        return int(time.mktime(time.strptime(before, "%Y-%m-%d")))
+    return int(time.time()) - int(ARCHIVE_AFTER_DAYS if days is None else days) * 86400
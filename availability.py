@@ -0,0 +1,171 @@
+# live available/booked counts for the catalogue page.
+# every process keeps the counts of all entries in memory and follows entry_change (see models.py) for what changed,
+# which catches bookings from any worker as well as anything done in the CLI.
+# open pages listen on /api/availability/stream (server-sent events) and only patch the rows that changed,
+# so nobody has to refresh the whole table to see if something is still there
+from flask import Flask, Response, current_app, jsonify, request
+from threading import Event, Lock, Thread
+import json
+import os
+import queue
+import time
+
+from models import db, EntryChange, Entry, entryChangesSince, latestEntryChange
+
+AVAILABILITY_POLL_SECONDS = 0.5 # how often entry_change is checked, so how late a page can be
+STREAM_SECONDS = 55 # streams are closed after this and the browser reconnects, so a stream never holds a thread forever
+STREAM_HEARTBEAT_SECONDS = 15 # keeps proxies from closing a quiet stream
+STREAM_RETRY_MS = 2000 # how long the browser waits before reconnecting
+MAX_STREAMS = 8 # per process. every open stream holds one of the server's threads, past this pages poll /api/availability instead
+MAX_IDS_PER_LOOKUP = 500
+
+class AvailabilityIndex:
+    def __init__(self, app: Flask, maxStreams: int):
+        self.app = app
+        self.maxStreams = maxStreams
+        self.counts: dict[int, tuple[int, int]] = {} # entry id : (available, booked)
+        self.seq = 0 # the entry_change the counts are up to date with
+        self.lock = Lock()
+        self.subscribers: set[queue.Queue] = set()
+        self.pid = None
+        self.wake = Event()
+
+    # starts following entry_change the first time anyone needs the counts.
+    # like the write queue, this has to happen after gunicorn forks, threads dont survive a fork
+    def ensureRunning(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.subscribers = set()
+            with db.engine.connect() as conn:
+                self.reload(conn)
+            self.pid = os.getpid()
+        Thread(target=self.run, name="catalogue-availability", daemon=True).start()
+
+    # reads every entry's counts. each query sees its own snapshot, so seq is read first: a change that lands in between
+    # is already in the counts and gets applied again at the next poll, which only rewrites the same numbers
+    def reload(self, conn):
+        self.seq = latestEntryChange(conn)
+        self.counts = {entryId: (available, booked) for entryId, available, booked in conn.execute(db.select(Entry.id, Entry.available, Entry.booked))}
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                self.wake.wait(AVAILABILITY_POLL_SECONDS)
+                self.wake.clear()
+                try:
+                    # a new connection every time, holding one open would keep sqlite from ever checkpointing the WAL
+                    with db.engine.connect() as conn:
+                        self.poll(conn)
+                except Exception:
+                    self.app.logger.exception("couldn't check entry_change")
+
+    def poll(self, conn):
+        seq, changes = entryChangesSince(conn, self.seq)
+        if seq == self.seq:
+            return
+        with self.lock:
+            if changes is None:
+                # fell too far behind, start over and have every page ask again
+                self.reload(conn)
+                message = (self.seq, None)
+            else:
+                for entryId, counts in changes.items():
+                    if counts is None:
+                        self.counts.pop(entryId, None)
+                    else:
+                        self.counts[entryId] = counts
+                self.seq = seq
+                message = (seq, changes)
+            for subscriber in self.subscribers:
+                subscriber.put(message)
+
+    # something in this process just changed entries, check now instead of at the next poll
+    def poke(self):
+        self.wake.set()
+
+    # current counts for some entries, with the seq they're up to date with
+    def lookup(self, ids: list[int]) -> tuple[int, dict[int, tuple[int, int] | None]]:
+        self.ensureRunning()
+        with self.lock:
+            return self.seq, {entryId: self.counts.get(entryId) for entryId in ids}
+
+    # a queue that gets (seq, changes) for everything after `since`, or None if there are too many streams open already
+    def subscribe(self, since: int) -> queue.Queue | None:
+        self.ensureRunning()
+        with self.lock:
+            if len(self.subscribers) >= self.maxStreams:
+                return None
+            subscriber = queue.Queue()
+            if since < self.seq:
+                # the page is older than what we have, catch it up first
+                with db.engine.connect() as conn:
+                    ids = conn.execute(db.select(EntryChange.entryId).distinct().where(EntryChange.seq > since, EntryChange.seq <= self.seq)).scalars().all()
+                    oldest = conn.execute(db.select(db.func.min(EntryChange.seq))).scalar() or 0
+                subscriber.put((self.seq, None if oldest > since + 1 else {entryId: self.counts.get(entryId) for entryId in ids}))
+            self.subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+# --- routes ---
+
+def countsJSON(changes: dict[int, tuple[int, int] | None]) -> dict:
+    return {str(entryId): None if counts is None else list(counts) for entryId, counts in changes.items()}
+
+# GET /api/availability?ids=1,2,3
+# current counts for those entries (null for ones that dont exist anymore)
+def availabilityLookup():
+    try:
+        ids = [int(entryId) for entryId in request.args.get("ids", "").split(",") if entryId]
+    except ValueError:
+        return jsonify({"error": "ids should be numbers separated by commas"}), 400
+    if len(ids) > MAX_IDS_PER_LOOKUP:
+        return jsonify({"error": f"at most {MAX_IDS_PER_LOOKUP} ids at a time"}), 400
+    seq, counts = current_app.extensions["availability"].lookup(ids)
+    return jsonify({"seq": seq, "counts": countsJSON(counts)})
+
+# GET /api/availability/stream?since=<seq>
+# server-sent events, "counts" with {id: [available, booked] or null} every time entries change,
+# and "resync" if the page missed too much and should ask for its rows again
+def availabilityStream():
+    index: AvailabilityIndex = current_app.extensions["availability"]
+    try:
+        # the browser sends the last id it saw when reconnecting, the page passes the seq it was rendered with the first time
+        since = int(request.headers.get("Last-Event-ID") or request.args.get("since") or 0)
+    except ValueError:
+        since = 0
+    subscriber = index.subscribe(since)
+    if subscriber is None:
+        # 204 tells the browser not to reconnect, the page polls /api/availability instead and asks for a stream again later
+        return Response(status=204)
+
+    def events():
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        closeAt = time.monotonic() + STREAM_SECONDS
+        while time.monotonic() < closeAt:
+            try:
+                seq, changes = subscriber.get(timeout=min(STREAM_HEARTBEAT_SECONDS, max(closeAt - time.monotonic(), 0)))
+            except queue.Empty:
+                yield ": still here\n\n"
+                continue
+            if changes is None:
+                yield f"id: {seq}\nevent: resync\ndata: {{}}\n\n"
+            else:
+                yield f"id: {seq}\nevent: counts\ndata: {json.dumps(countsJSON(changes))}\n\n"
+
+    response = Response(events(), mimetype="text/event-stream")
+    # runs when the stream ends for any reason, including the browser going away
+    response.call_on_close(lambda: index.unsubscribe(subscriber))
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no" # tells nginx not to hold the events back
+    return response
+
+# the stream limit can be changed with app.config["AVAILABILITY_MAX_STREAMS"]
+def initAvailability(app: Flask):
+    maxStreams = app.config.setdefault("AVAILABILITY_MAX_STREAMS", MAX_STREAMS)
+    app.extensions["availability"] = AvailabilityIndex(app, maxStreams)
+    app.add_url_rule("/api/availability", "availability", availabilityLookup)
+    app.add_url_rule("/api/availability/stream", "availabilityStream", availabilityStream)
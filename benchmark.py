@@ -0,0 +1,419 @@
+# load-testing benchmark for the website and the CLI.
+# it fills a scratch database (never project.db) with made-up rows, then times:
+#   - every page through flask's test client, one request at a time
+#   - a real server (same one 'python main.py serve' runs) under concurrent HTTP load
+#   - the CLI's search and remove paths
+# and prints (or saves) p50/p95/p99 latency, throughput and peak memory as JSON,
+# so runs from before and after a change can be compared with --compare
+#
+#   python benchmark.py --entries 10000 --bookings 100000 --requests 5000 --output before.json
+#   python benchmark.py ... --output after.json --compare before.json
+
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+try:
+    import resource # unix only, peak memory is left out on windows
+except ImportError:
+    resource = None
+
+SEED_BATCH_SIZE = 10000
+SEED_HISTORY_DAYS = 3 * 365 # seeded bookings are spread over this many days
+SERVER_START_TIMEOUT = 60 # seconds to wait for the server to answer before giving up
+HTTP_TIMEOUT = 120 # seconds a single request may take during the load test
+
+# words the made-up rows are built from, so searches have something realistic to match
+WORDS = ["beaker", "flask", "pipette", "burette", "magnet", "resistor", "battery", "multimeter", "microscope", "slide",
+         "funnel", "tongs", "goggles", "thermometer", "prism", "lens", "spring", "pulley", "circuit", "breadboard",
+         "arduino", "servo", "motor", "sensor", "clamp", "stand", "crucible", "tripod", "gauze", "scale"]
+PLACES = ["cupboard", "shelf", "drawer", "tray", "box", "cabinet"]
+NAMES = ["alex", "sam", "jordan", "taylor", "casey", "riley", "morgan", "jamie", "drew", "robin"]
+
+# --- numbers ---
+
+# exact percentiles from all the samples (nearest rank), times in milliseconds
+def summarize(samples: list[float], seconds: float, errors: int = 0) -> dict:
+    ordered = sorted(samples)
+    def percentile(p: float) -> float:
+        if not ordered: return 0.0
+        return ordered[min(len(ordered) - 1, max(0, round(p * len(ordered)) - 1))] * 1000
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": ordered[-1] * 1000 if ordered else 0.0,
+        "mean": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+        "throughput": len(ordered) / seconds if seconds > 0 else 0.0, # per second
+    }
+
+# peak resident memory in MB, of this process or of its finished child processes
+def peakRSS(who: str) -> float | None:
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN).ru_maxrss
+    # linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# runs call over and over until it has run `iterations` times or `maxSeconds` have passed
+def timeRepeatedly(call, iterations: int, maxSeconds: float) -> dict:
+    samples = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        before = time.perf_counter()
+        try:
+            call(i)
+        except Exception:
+            errors += 1
+        samples.append(time.perf_counter() - before)
+        if time.perf_counter() - started > maxSeconds:
+            break
+    return summarize(samples, time.perf_counter() - started, errors)
+
+# --- scratch database ---
+
+def entryName(i: int) -> str:
+    return f"{WORDS[i % len(WORDS)]} {i:07d}"
+
+# fills a new database at path with the given number of rows.
+# rows go in straight through sqlite before the app ever sees the database, the search indexes and
+# change tracking triggers are then built in one go by initDatabase, which is much faster than a trigger per row
+def seedDatabase(path: str, entries: int, bookings: int, requests: int, seed: int):
+    from sqlalchemy import create_engine
+    from models import db, migrations
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    booked = [0] * entries
+    def batches(total: int, makeRow):
+        for start in range(0, total, SEED_BATCH_SIZE):
+            yield [makeRow(i) for i in range(start, min(total, start + SEED_BATCH_SIZE))]
+    for rows in batches(entries, lambda i: (i + 1, entryName(i), f"{rng.choice(PLACES)} {rng.randint(1, 40)}", f"/static/img/{i % 50}.jpg", rng.randint(0, 30))):
+        conn.executemany('INSERT INTO entry (id, name, "locationText", "locationImg", available, booked) VALUES (?, ?, ?, ?, ?, 0)', rows)
+    now = int(time.time())
+    def makeBooking(i: int):
+        entry = rng.randrange(entries)
+        booked[entry] += 1
+        # spread over the last few years, so the analytics rollups have history to go through
+        return (i + 1, entry + 1, entryName(entry), f"{rng.choice(NAMES)} {rng.randint(1, 999)}", f"for {rng.choice(WORDS)} practical, period {rng.randint(1, 6)}",
+                now - rng.randrange(SEED_HISTORY_DAYS * 86400))
+    if entries:
+        for rows in batches(bookings, makeBooking):
+            conn.executemany('INSERT INTO booking (id, "entryId", "bookedMaterial", "bookedBy", "bookInfo", "bookedAt") VALUES (?, ?, ?, ?, ?, ?)', rows)
+    conn.executemany("UPDATE entry SET booked = ? WHERE id = ?", ((count, i + 1) for i, count in enumerate(booked) if count))
+    for rows in batches(requests, lambda i: (i + 1, f"{rng.choice(WORDS)} request {i:07d}", rng.choice(NAMES), f"need {rng.randint(1, 30)} for {rng.choice(WORDS)}")):
+        conn.executemany('INSERT INTO material_request (id, material, "requestBy", info) VALUES (?, ?, ?, ?)', rows)
+    # the rollup triggers dont exist yet either, so the totals they would have kept are added up here
+    conn.execute('INSERT INTO booking_daily (material, day, bookings) SELECT "bookedMaterial", "bookedAt" / 86400, count(*) FROM booking GROUP BY 1, 2')
+    conn.execute('INSERT INTO booking_total (material, bookings, "lastDay") SELECT material, sum(bookings), max(day) FROM booking_daily GROUP BY material')
+    conn.execute('INSERT INTO booking_day_total (day, bookings) SELECT day, sum(bookings) FROM booking_daily GROUP BY day')
+    conn.execute('INSERT INTO request_demand (material, asks, "lastAskedAt") SELECT material, 1, ? FROM material_request', (now,))
+    # the tables already match the models, so no migration should run on them
+    conn.execute("INSERT INTO schema_version (id, version) VALUES (1, ?)", (len(migrations),))
+    conn.commit()
+    conn.close()
+
+def databaseConfig(path: str) -> dict:
+    return {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(path)}"}
+
+# --- test client ---
+
+# one request at a time through flask's test client, so this is the app's own time without any network or server
+def benchTestClient(path: str, volumes: dict, iterations: int, maxSeconds: float, seed: int) -> dict:
+    from webapp import createApp, pageCache
+    rng = random.Random(seed)
+    app = createApp(databaseConfig(path))
+    client = app.test_client()
+    entries = max(volumes["entries"], 1)
+
+    # the body is read as part of the timing: streamed pages are only rendered (and put in the cache) while it's read
+    def get(url: str, expected: tuple = (200,)):
+        response = client.get(url)
+        try:
+            response.get_data()
+        finally:
+            response.close()
+        if response.status_code not in expected:
+            raise Exception(f"{url} answered {response.status_code}")
+
+    # cached pages are timed twice: as they usually are (from the cache), and cold (rendered from the database every time)
+    def cold(url: str):
+        def call(i):
+            pageCache.clear()
+            get(url)
+        return call
+
+    scenarios = {
+        "lookup": lambda i: get("/db/"),
+        "lookup (cold)": cold("/db/"),
+        "lookupBookings": lambda i: get("/db/bookings"),
+        "lookupBookings (cold)": cold("/db/bookings"),
+        "lookupRequests": lambda i: get("/db/requests"),
+        "lookupRequests (cold)": cold("/db/requests"),
+        "apiEntries": lambda i: get(f"/api/entries?q={urllib.parse.quote(rng.choice(WORDS)[:3])}"),
+        "apiSearch": lambda i: get(f"/api/search/entries?q={urllib.parse.quote(rng.choice(WORDS))}"),
+        "analytics": lambda i: get("/analytics"),
+        "apiAnalytics": lambda i: get("/api/analytics?days=365"),
+        # the writes go last, every one of them throws the cached pages away
+        "booking": lambda i: get(f"/book/{urllib.parse.quote(entryName(rng.randrange(entries)))}?name=bench&info=benchmark", (302,)),
+        "makeRequest": lambda i: get(f"/request?material={urllib.parse.quote(f'bench request {seed} {i}')}&name=bench&info=benchmark", (302,)),
+    }
+    results = {}
+    for name, call in scenarios.items():
+        if volumes["entries"] == 0 and name == "booking":
+            continue
+        print(f"  test client: {name}", file=sys.stderr)
+        results[name] = timeRepeatedly(call, iterations, maxSeconds)
+    return results
+
+# --- HTTP load ---
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def waitForServer(baseURL: str):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(baseURL + "/", timeout=5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"the server at {baseURL} never answered")
+
+# redirects are answers too, following them would time the success page instead
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+# starts the real server in another process and has `concurrency` threads hammer it with a mix of requests for `duration` seconds
+def benchHTTP(path: str, volumes: dict, concurrency: int, duration: float, workers: int, threads: int, seed: int) -> dict:
+    from main import runServer
+    port = freePort()
+    baseURL = f"http://127.0.0.1:{port}"
+    # the benchmark's server shouldnt take the admin channel from a real one
+    server = Process(target=runServer, args=(f"127.0.0.1:{port}", workers, threads, databaseConfig(path) | {"ADMIN_CHANNEL": False}))
+    server.start()
+    try:
+        waitForServer(baseURL)
+        entries = max(volumes["entries"], 1)
+        # route : [how often it's picked, url maker]. roughly what people actually do, mostly reading
+        mix = {
+            "lookup": [30, lambda rng, n: "/db/"],
+            "apiEntries": [20, lambda rng, n: f"/api/entries?q={urllib.parse.quote(rng.choice(WORDS)[:3])}"],
+            "apiSearch": [15, lambda rng, n: f"/api/search/entries?q={urllib.parse.quote(rng.choice(WORDS))}"],
+            "lookupRequests": [10, lambda rng, n: "/db/requests"],
+            "lookupBookings": [5, lambda rng, n: "/db/bookings"],
+            "analytics": [2, lambda rng, n: "/analytics"],
+            "booking": [15, lambda rng, n: f"/book/{urllib.parse.quote(entryName(rng.randrange(entries)))}?name=bench&info=load"],
+            "makeRequest": [5, lambda rng, n: f"/request?material={urllib.parse.quote(f'load request {seed} {n}')}&name=bench&info=load"],
+        }
+        if volumes["entries"] == 0:
+            del mix["booking"]
+        routes = list(mix.keys())
+        weights = [mix[route][0] for route in routes]
+        opener = urllib.request.build_opener(NoRedirects)
+        deadline = time.monotonic() + duration
+
+        def worker(number: int) -> dict[str, list]:
+            rng = random.Random(seed * 1000 + number)
+            samples = {route: [[], 0] for route in routes} # route : [latencies, errors]
+            sent = 0
+            while time.monotonic() < deadline:
+                route = rng.choices(routes, weights)[0]
+                url = baseURL + mix[route][1](rng, f"{number}-{sent}")
+                sent += 1
+                before = time.perf_counter()
+                try:
+                    with opener.open(url, timeout=HTTP_TIMEOUT) as response:
+                        response.read()
+                except urllib.error.HTTPError as e:
+                    if e.code != 302: # the writes answer with a redirect to /Success
+                        samples[route][1] += 1
+                        continue
+                except OSError:
+                    samples[route][1] += 1
+                    continue
+                samples[route][0].append(time.perf_counter() - before)
+            return samples
+
+        print(f"  http: {concurrency} clients for {duration:.0f}s", file=sys.stderr)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            perWorker = list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.join()
+
+    results = {}
+    for route in routes:
+        latencies = [sample for samples in perWorker for sample in samples[route][0]]
+        results[route] = summarize(latencies, elapsed, sum(samples[route][1] for samples in perWorker))
+    results["all"] = summarize([sample for samples in perWorker for route in routes for sample in samples[route][0]], elapsed,
+                               sum(samples[route][1] for samples in perWorker for route in routes))
+    return results
+
+# --- CLI ---
+
+# the CLI's own search and remove paths, as batch commands so nothing is asked
+def benchCLI(path: str, volumes: dict, iterations: int, maxSeconds: float, seed: int) -> dict:
+    import cli
+    from models import db, Entry, Booking, MaterialRequest, search
+    rng = random.Random(seed)
+    cli.batchMode = True
+    results = {}
+    with cli.createCLIApp(databaseConfig(path)).app_context():
+        # ids to remove, picked up front so every remove hits a row that exists
+        def someIds(model) -> list[int]:
+            ids = db.session.execute(db.select(model.id)).scalars().all()
+            return rng.sample(ids, min(iterations, len(ids)))
+        toRemove = {kind: someIds(model) for kind, model in [("entry", Entry), ("booking", Booking), ("request", MaterialRequest)]}
+
+        def run(command: str):
+            with redirect_stdout(io.StringIO()): # the tables it prints arent what's being timed
+                cli.runCommand(command)
+            db.session.commit()
+
+        scenarios = {
+            "search entries": lambda i: search(Entry, rng.choice(WORDS)),
+            "search bookings": lambda i: search(Booking, rng.choice(NAMES)),
+            "search requests": lambda i: search(MaterialRequest, rng.choice(WORDS)),
+            "view entries": lambda i: run(f"view entries --filter name={rng.choice(WORDS)} --page {rng.randint(1, 5)}"),
+            "remove booking": lambda i: run(f"remove booking --id {toRemove['booking'][i]}"),
+            "remove request": lambda i: run(f"remove request --id {toRemove['request'][i]}"),
+            # removing an entry also removes all of its bookings
+            "remove entry": lambda i: run(f"remove entry --id {toRemove['entry'][i]}"),
+        }
+        for name, call in scenarios.items():
+            kind = name.split()[-1]
+            count = len(toRemove[kind]) if name.startswith("remove") else iterations
+            if count == 0:
+                continue
+            print(f"  cli: {name}", file=sys.stderr)
+            results[name] = timeRepeatedly(call, count, maxSeconds)
+    return results
+
+# --- comparing runs ---
+
+# prints every latency that got more than `tolerance` times slower than in the baseline, returns how many did
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    regressions = 0
+    for phase in ["testClient", "http", "cli"]:
+        for name, numbers in results.get(phase, {}).items():
+            old = baseline.get(phase, {}).get(name)
+            if old is None: continue
+            for stat in ["p50", "p95", "p99"]:
+                # anything under a millisecond is too noisy to call a regression
+                if numbers[stat] > max(old[stat], 1.0) * tolerance:
+                    print(f"slower: {phase} {name} {stat} {old[stat]:.1f} ms -> {numbers[stat]:.1f} ms", file=sys.stderr)
+                    regressions += 1
+    return regressions
+
+def gitCommit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the website and CLI against a scratch database, results are printed as JSON")
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--bookings", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=1, help="same seed, same rows and same requests")
+    parser.add_argument("--db", help="where to put the scratch database (default: a temporary folder that is deleted afterwards)")
+    parser.add_argument("--reuse", action="store_true", help="use the database at --db as it is instead of filling a new one")
+    parser.add_argument("--iterations", type=int, default=200, help="test client and CLI calls per scenario")
+    parser.add_argument("--max-seconds", type=float, default=30, help="stop a scenario after this long even if it hasnt done all its iterations")
+    parser.add_argument("--concurrency", type=int, default=16, help="simultaneous HTTP clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of HTTP load")
+    parser.add_argument("--workers", type=int, default=(os.cpu_count() or 1) + 1, help="server worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="threads per server worker")
+    parser.add_argument("--skip", action="append", default=[], choices=["testClient", "http", "cli"], help="leave out a phase (can be given more than once)")
+    parser.add_argument("--output", help="save the results to this file as well")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file of an earlier run, exits with 1 if anything got slower")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="how many times slower than the baseline counts as a regression")
+    args = parser.parse_args()
+
+    volumes = {"entries": args.entries, "bookings": args.bookings, "requests": args.requests}
+    scratch = None
+    if args.db is None:
+        scratch = tempfile.TemporaryDirectory(prefix="catalogue-bench-")
+        args.db = os.path.join(scratch.name, "bench.db")
+    results = {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": gitCommit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "volumes": volumes,
+            "args": {key: value for key, value in vars(args).items() if key not in ["output", "compare"]},
+        },
+    }
+
+    try:
+        if not args.reuse:
+            for suffix in ["", "-wal", "-shm"]:
+                if os.path.exists(args.db + suffix):
+                    os.remove(args.db + suffix)
+            print(f"filling {args.db}", file=sys.stderr)
+            started = time.perf_counter()
+            seedDatabase(args.db, args.entries, args.bookings, args.requests, args.seed)
+            # building the search indexes and triggers is part of getting the database ready, so it's timed too
+            from cli import createCLIApp
+            from models import db
+            with createCLIApp(databaseConfig(args.db)).app_context():
+                # the server is forked from this process, and sqlite breaks if a forked process
+                # inherits an open connection (closing it there drops the locks of the real ones)
+                db.engine.dispose()
+            results["seedSeconds"] = time.perf_counter() - started
+
+        # the server is started before this process has loaded the website, so forking it doesnt copy any of that
+        if "http" not in args.skip:
+            results["http"] = benchHTTP(args.db, volumes, args.concurrency, args.duration, args.workers, args.threads, args.seed)
+        if "testClient" not in args.skip:
+            results["testClient"] = benchTestClient(args.db, volumes, args.iterations, args.max_seconds, args.seed)
+        if "cli" not in args.skip:
+            results["cli"] = benchCLI(args.db, volumes, args.iterations, args.max_seconds, args.seed)
+        results["peakRSSMB"] = {"benchmark": peakRSS("self"), "server": peakRSS("children") if "http" not in args.skip else None}
+    finally:
+        if scratch is not None:
+            scratch.cleanup()
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        print(f"{regressions} regression(s) compared to {args.compare}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
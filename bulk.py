@@ -0,0 +1,182 @@
+# importing/exporting whole tables, used by both the CLI and 'python main.py import/export'
+import csv
+import json
+import time
+from itertools import islice
+from typing import Iterator, TextIO
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Entry, Booking, BookingArchive, MaterialRequest
+from images import prepareImages
+
+# --- bulk import/export ---
+# moves whole tables in and out of CSV, TSV (what google sheets exports) or JSON Lines files (one json object per line), 
+# picked by file extension. 
+# files are read and written a batch at a time, so they never have to fit in memory
+
+BULK_BATCH_SIZE = 1000
+MAX_REPORTED_CONFLICTS = 50 # past this, conflicts are only counted
+
+# kind : [model, columns in the file, unique column or None, {column: default when missing}]
+bulkTables: dict[str, list] = {
+    "entries" : [Entry, ["name", "locationText", "locationImg", "available", "booked"], "name", {"locationText": "", "locationImg": "", "booked": 0}],
+    "bookings" : [Booking, ["bookedMaterial", "bookedBy", "bookInfo"], None, {"bookInfo": ""}],
+    "requests" : [MaterialRequest, ["material", "requestBy", "info"], "material", {"info": ""}],
+    "archive" : [BookingArchive, ["bookedMaterial", "bookedBy", "bookInfo", "bookedAt", "archivedAt"], None, {"bookInfo": ""}],
+}
+# bookings (live or archived) can only be exported, importing them would also have to redo the booked counts
+importableKinds = ["entries", "requests"]
+
+class ImportStats:
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.conflicts: list[str] = []
+        self.started = time.perf_counter()
+    
+    def conflict(self, message: str):
+        if len(self.conflicts) < MAX_REPORTED_CONFLICTS:
+            self.conflicts.append(message)
+    
+    def report(self, verb: str, rows: int, out: TextIO | None = None):
+        seconds = time.perf_counter() - self.started
+        for message in self.conflicts:
+            print(f"  {message}", file=out)
+        hidden = self.skipped + self.rejected + self.updated - len(self.conflicts)
+        if hidden > 0: print(f"  ...and {hidden} more", file=out)
+        print(f"{verb} {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):.0f} rows/sec)", file=out)
+
+def isJSONLines(path: str) -> bool:
+    return path.lower().endswith((".jsonl", ".ndjson"))
+
+def csvDelimiter(path: str) -> str:
+    return "\t" if path.lower().endswith(".tsv") else ","
+
+# yields (line number, row) one at a time.
+# json lines come out as the line's text, cleanRow parses them so one broken line only rejects itself
+def readRows(path: str) -> Iterator[tuple[int, dict | str]]:
+    with open(path, newline="", encoding="utf-8") as file:
+        if isJSONLines(path):
+            for lineNumber, line in enumerate(file, start=1):
+                if line.strip():
+                    yield lineNumber, line
+        else:
+            reader = csv.DictReader(file, delimiter=csvDelimiter(path))
+            for row in reader:
+                yield reader.line_num, row
+
+# checks one row from a file and fills in defaults, raises ValueError if it cant be used. 
+# integerColumns is worked out once per import, looking it up per row is surprisingly slow
+def cleanRow(kind: str, row: dict | str, integerColumns: set[str]) -> dict:
+    model, columns, key, defaults = bulkTables[kind]
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"not valid json, {e.msg} at column {e.pos + 1}")
+    if not isinstance(row, dict):
+        raise ValueError(f"expected an object like {{\"name\": ...}}, got {type(row).__name__}")
+    cleaned = {}
+    for name in columns:
+        value = row.get(name)
+        if value is None or value == "":
+            if name not in defaults: raise ValueError(f"missing '{name}'")
+            value = defaults[name]
+        if name in integerColumns:
+            value = int(value)
+        elif not isinstance(value, str):
+            value = str(value)
+        cleaned[name] = value
+    return cleaned
+
+# mode is "insert" (rows whose name already exists are skipped) or "upsert" (they are updated instead). 
+# everything goes through executemany in one transaction, which is committed at the end unless commit is False.
+# the report is printed to out (the terminal if None)
+def importRows(kind: str, path: str, mode: str = "insert", commit: bool = True, out: TextIO | None = None) -> ImportStats:
+    if kind not in importableKinds: raise Exception(f"can only import {', '.join(importableKinds)}")
+    if mode not in ["insert", "upsert"]: raise Exception("mode has to be 'insert' or 'upsert'")
+    model, columns, key, defaults = bulkTables[kind]
+    keyColumn = getattr(model, key)
+    # booked is a live counter, so an upsert leaves it alone
+    updateColumns = [name for name in columns if name not in [key, "booked"]]
+    # core statements on the table itself, the ORM bulk path does a lot of per-row work we dont need
+    insertStatement = db.insert(model.__table__)
+    # INSERT ... ON CONFLICT DO UPDATE is written the same way on both, but each dialect has its own insert() for it
+    upsert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}[db.engine.dialect.name](model.__table__)
+    upsert = upsert.on_conflict_do_update(index_elements=[key], set_={name: upsert.excluded[name] for name in updateColumns})
+    
+    integerColumns = {c.name for c in model.__table__.columns if isinstance(c.type, db.Integer)}
+    stats = ImportStats()
+    locationImgs = set() # thumbnails are made once everything is in
+    rows = readRows(path)
+    total = 0
+    while batch := list(islice(rows, BULK_BATCH_SIZE)):
+        total += len(batch)
+        fresh: dict[str, dict] = {}
+        for lineNumber, row in batch:
+            try:
+                row = cleanRow(kind, row, integerColumns)
+            except (ValueError, TypeError) as e:
+                stats.rejected += 1
+                stats.conflict(f"line {lineNumber}: rejected, {e}")
+                continue
+            if row[key] in fresh:
+                # the same name twice in one batch, the first one wins
+                stats.skipped += 1
+                stats.conflict(f"line {lineNumber}: {key} '{row[key]}' appears earlier in the file, skipped")
+                continue
+            fresh[row[key]] = row | {"_line": lineNumber}
+        
+        # one indexed lookup for the whole batch instead of one per row. 
+        # earlier batches are already inserted (same transaction), so this also catches repeats across the file
+        existing = set(db.session.execute(db.select(keyColumn).where(keyColumn.in_(fresh.keys()))).scalars())
+        toInsert, toUpdate = [], []
+        for name, row in fresh.items():
+            lineNumber = row.pop("_line")
+            if name not in existing:
+                toInsert.append(row)
+            elif mode == "upsert":
+                toUpdate.append(row)
+                stats.conflict(f"line {lineNumber}: {key} '{name}' already exists, updated")
+            else:
+                stats.skipped += 1
+                stats.conflict(f"line {lineNumber}: {key} '{name}' already exists, skipped")
+        if toInsert:
+            db.session.connection().execute(insertStatement, toInsert)
+        if toUpdate:
+            db.session.connection().execute(upsert, toUpdate)
+        stats.inserted += len(toInsert)
+        stats.updated += len(toUpdate)
+        if "locationImg" in columns:
+            locationImgs.update(row["locationImg"] for row in toInsert + toUpdate)
+    
+    if commit:
+        db.session.commit()
+    stats.report("read", total, out)
+    print(f"{stats.inserted} added, {stats.updated} updated, {stats.skipped} skipped, {stats.rejected} rejected", file=out)
+    if locationImgs:
+        print(f"made thumbnails for {prepareImages(locationImgs, out=out)} images", file=out)
+    print(file=out)
+    return stats
+
+# streams a table out to a file, rows are fetched from the database a batch at a time
+def exportRows(kind: str, path: str, out: TextIO | None = None) -> int:
+    if kind not in bulkTables: raise Exception(f"can only export {', '.join(bulkTables.keys())}")
+    model, columns, key, defaults = bulkTables[kind]
+    started = time.perf_counter()
+    count = 0
+    query = db.select(*[getattr(model, name) for name in columns]).order_by(model.id).execution_options(yield_per=BULK_BATCH_SIZE)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = None if isJSONLines(path) else csv.writer(file, delimiter=csvDelimiter(path))
+        if writer: writer.writerow(columns)
+        for row in db.session.execute(query):
+            if writer:
+                writer.writerow(row)
+            else:
+                file.write(json.dumps(dict(zip(columns, row))) + "\n")
+            count += 1
+    seconds = time.perf_counter() - started
+    print(f"wrote {count} rows to {path} in {seconds:.2f}s ({count / max(seconds, 1e-9):.0f} rows/sec)\n", file=out)
+    return count
@@ -0,0 +1,600 @@
+# the command-line interface. 
+# this will be the only way of adding things to the database for now
+from flask import Flask, current_app
+import tabulate
+from typing import Callable, Iterable, TextIO
+import shlex
+import sys
+import json
+import time
+import urllib.request
+
+from sqlalchemy import or_, and_
+from models import db, initApp, configureApp, Entry, Booking, BookingArchive, MaterialRequest, TableVersion, search, searchFilter, searchIndexFor, searchQuery
+# bulk.py, archive.py, images.py (and pillow) and metrics.py are imported by the commands that use them,
+# so starting the CLI or a batch doesnt wait for them
+
+# --- handling command-line input. ---
+
+# every command can take its answers as flags (--name value or --name=value) instead of being asked for them. 
+# in batch mode (python main.py --batch file) nothing is ever asked, a missing flag is an error instead
+batchMode = False
+# where questions are asked. the admin channel (admin.py) swaps this out to ask the console that sent the command instead
+askUser: Callable[[str], str] = input
+# where everything the CLI prints goes, None is this terminal. the admin channel points it at the console that sent the command
+output: TextIO | None = None
+
+# splits a command into its positional arguments and its flags. 
+# positional arguments stay padded with an empty string, like the command handler does
+def splitFlags(command: list[str]) -> tuple[list[str], dict[str, str]]:
+    tokens = command[:-1] if command and command[-1] == "" else command
+    positional, flags = [], {}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.startswith("--") and len(token) > 2:
+            name, hasValue, value = token[2:].partition("=")
+            # a flag with nothing after it (or another flag) is a switch, like --desc
+            if not hasValue and i + 1 < len(tokens) and not tokens[i + 1].startswith("--"):
+                i += 1
+                value = tokens[i]
+            flags[name] = value
+        else:
+            positional.append(token)
+        i += 1
+    positional.append("")
+    return positional, flags
+
+# the value of a flag, or asks the user for it if it wasnt given
+def ask(flags: dict[str, str], name: str, prompt: str) -> str:
+    if name in flags: return flags[name]
+    if batchMode: raise Exception(f"missing --{name}")
+    return askUser(prompt)
+
+# the ID of the row to work on, from --id or asked for after showing the search results. None means cancelled
+def chooseId(flags: dict[str, str], prompt: str) -> int | None:
+    if "id" in flags: return int(flags["id"])
+    if batchMode: raise Exception("missing --id")
+    choice = ""
+    while not choice.isdigit() and choice != "x":
+        choice = askUser(prompt)
+    return None if choice == "x" else int(choice)
+
+def printEntries(elements: list[Entry]):
+    print(
+        tabulate.tabulate(
+            [[element.id, element.name, element.locationText, element.locationImg, element.available, element.booked] for element in elements], 
+            ("id", "name", "location text", "location image", "available", "booked"),
+            maxcolwidths=10
+        ), "\n", file=output
+    )
+
+def printBookings(elements: list[Booking]):
+    print(
+        tabulate.tabulate(
+            [[element.id, element.bookedBy, element.bookedMaterial, element.bookInfo] for element in elements], 
+            ("id", "name", "material", "info"),
+            maxcolwidths=10
+        ), "\n", file=output
+    )
+
+def dateText(unixTime: int | None) -> str:
+    return "" if unixTime is None else time.strftime("%Y-%m-%d", time.localtime(unixTime))
+
+def printArchivedBookings(elements: list[BookingArchive]):
+    print(
+        tabulate.tabulate(
+            [[element.id, element.bookedBy, element.bookedMaterial, element.bookInfo, dateText(element.bookedAt), dateText(element.archivedAt)] for element in elements], 
+            ("id", "name", "material", "info", "booked", "archived"),
+            maxcolwidths=10
+        ), "\n", file=output
+    )
+
+def printRequests(elements: list[MaterialRequest]):
+    print(
+        tabulate.tabulate(
+            [[element.id, element.material, element.requestBy, element.info] for element in elements], 
+            ("id", "material", "booked by", "info"),
+            maxcolwidths=10
+        ), "\n", file=output
+    )
+
+# --- paging through tables ---
+
+# kind : [model, columns that can be sorted/filtered by, function that prints rows, default sort, rows per page]
+viewTables: dict[str, list] = {
+    "entries" : [Entry, ["id", "name", "locationText", "locationImg", "available", "booked"], printEntries, "name", 10],
+    "bookings" : [Booking, ["id", "bookedBy", "bookedMaterial", "bookInfo"], printBookings, "bookedMaterial", 5],
+    "requests" : [MaterialRequest, ["id", "material", "requestBy", "info"], printRequests, "material", 5],
+    "archive" : [BookingArchive, ["id", "bookedBy", "bookedMaterial", "bookInfo", "bookedAt", "archivedAt"], printArchivedBookings, "bookedMaterial", 5],
+}
+
+# fetches one page of a table per query, no matter how big the table is. 
+# pages are found by remembering the last (sort value, id) of each page seen so far, 
+# so going forward or back is an index range scan. jumping to a page that hasnt been seen uses OFFSET once
+class Pager:
+    def __init__(self, model, sort: str, descending: bool, filters: list, size: int):
+        self.model = model
+        self.sort = sort
+        self.sortColumn = getattr(model, sort)
+        # some columns (like bookedAt on archived bookings from before it existed) can be empty. those rows count as
+        # smaller than any value, so they come first going up and last going down, the same on sqlite and postgresql
+        self.nullable = model.__table__.c[sort].nullable
+        self.descending = descending
+        self.size = size
+        self.query = db.select(model).where(*filters)
+        if descending:
+            self.query = self.query.order_by(self.sortColumn.desc().nulls_last() if self.nullable else self.sortColumn.desc(), model.id.desc())
+        else:
+            self.query = self.query.order_by(self.sortColumn.nulls_first() if self.nullable else self.sortColumn, model.id)
+        # COUNT(*) only has to walk an index, unlike loading every row
+        self.total: int = db.session.execute(db.select(db.func.count()).select_from(model).where(*filters)).scalar_one()
+        self.pages = max(1, -(-self.total // size))
+        self.cursors: dict[int, tuple | None] = {1: None} # page : (sort value, id) of the row just before it
+    
+    # the rows after (value, lastId) in the page order
+    def after(self, value, lastId: int):
+        column, rowId = self.sortColumn, self.model.id
+        if value is None: # still among the empty ones
+            if self.descending:
+                return and_(column.is_(None), rowId < lastId)
+            return or_(column.is_not(None), and_(column.is_(None), rowId > lastId))
+        if self.descending:
+            later = or_(column < value, and_(column == value, rowId < lastId))
+            return or_(later, column.is_(None)) if self.nullable else later
+        return or_(column > value, and_(column == value, rowId > lastId))
+
+    def fetch(self, page: int) -> list:
+        query = self.query.limit(self.size)
+        if page in self.cursors:
+            if self.cursors[page] is not None:
+                query = query.where(self.after(*self.cursors[page]))
+        else:
+            query = query.offset((page - 1) * self.size)
+        rows = db.session.execute(query).scalars().all()
+        if rows:
+            self.cursors[page + 1] = (getattr(rows[-1], self.sort), rows[-1].id)
+        return rows
+
+# turns --filter column=text into a where clause. 
+# text columns in the search index are matched by word prefix through it, other text columns by substring, numbers exactly
+def columnFilter(model, columns: list[str], filterText: str):
+    columnName, hasValue, value = filterText.partition("=")
+    if not hasValue or columnName not in columns: 
+        raise Exception(f"invalid filter, expected --filter column=text where column is one of: {', '.join(columns)}")
+    column = getattr(model, columnName)
+    if isinstance(column.type, db.Integer):
+        return column == int(value)
+    if columnName in searchIndexFor(model)[1] and searchQuery(value):
+        return searchFilter(model, columnName, value)
+    return column.contains(value)
+
+def viewTable(kind: str, command: list[str]):
+    command, flags = splitFlags(command)
+    model, columns, printRows, defaultSort, defaultSize = viewTables[kind]
+    sort = flags.get("sort", defaultSort)
+    if sort not in columns: raise Exception(f"can only sort by: {', '.join(columns)}")
+    filters = [columnFilter(model, columns, flags["filter"])] if "filter" in flags else []
+    pager = Pager(model, sort, "desc" in flags, filters, int(flags.get("size", defaultSize)))
+    if pager.total == 0:
+        print(f"no {kind} found\n", file=output)
+        return
+    
+    page = min(max(int(flags.get("page", 1)), 1), pager.pages)
+    while True:
+        printRows(pager.fetch(page))
+        print(f"page {page} of {pager.pages} ({pager.total} {kind})\n", file=output)
+        if "all" in flags:
+            if page == pager.pages: return
+            page += 1
+            continue
+        if batchMode or pager.pages == 1:
+            return
+        choice = askUser(" CATA <enter/n: next, p: previous, page number, e: end> ").strip().lower()
+        if choice == "e" or ((choice == "" or choice == "n") and page == pager.pages):
+            return
+        elif choice == "p":
+            page = max(page - 1, 1)
+        elif choice.isdigit():
+            page = min(max(int(choice), 1), pager.pages)
+        else:
+            page = min(page + 1, pager.pages)
+
+# makes the thumbnail for an image that was just given. one that cant be read doesnt stop the command,
+# the page shows the image as it was given instead (pillow's UnidentifiedImageError is an OSError too)
+def thumbnailFor(locationImg: str):
+    from images import prepareImage
+    try:
+        prepareImage(locationImg)
+    except OSError as e:
+        print(f"couldn't make a thumbnail of '{locationImg}', the page will use it as it is: {e}", file=output)
+
+# add entry name [--locationText text] [--locationImg file] [--count n]
+def CLIAddEntry(command):
+    command, flags = splitFlags(command)
+    # command is padded with an empty string, so we check for that instead of the length of the command
+    if command[0] == "": raise Exception("invalid syntax, expected name of the entry. ")
+    locationText = ask(flags, "locationText", f"describe the location of the '{command[0]}': ")
+    locationImg = ask(flags, "locationImg", "enter the file name of the image showing its location: ")
+    available = int(ask(flags, "count", f"how many '{command[0]}'s are there: "))
+    thumbnailFor(locationImg)
+    try:
+        db.session.add(Entry(name=command[0], locationText=locationText, locationImg=locationImg, available=available, booked=0))
+    except Exception as e:
+        print(f"failed to add entry, it may already exist\n{e}\n", file=output)
+
+# what can be changed with 'edit', attribute : [prompt, column, type]
+entryAttributes: dict[str, list] = {
+    "locationText" : ["text location of {}: ", "locationText", str],
+    "locationImg" : ["image location of {}: ", "locationImg", str],
+    "count" : ["new number of available {}s: ", "available", int],
+}
+bookingAttributes: dict[str, list] = {
+    "name" : ["name of person booking {}: ", "bookedBy", str],
+    "info" : ["info for the booking: ", "bookInfo", str],
+}
+requestAttributes: dict[str, list] = {
+    "info" : ["replace info with: ", "info", str],
+}
+
+# an edit needs something to find the row by and something to change, either named or given as flags
+def checkEdit(command: list[str], flags: dict[str, str], attributes: dict[str, list]) -> bool:
+    attribute = command[1] if len(command) > 1 else ""
+    if attribute and attribute not in attributes: return False
+    if not attribute and not any(name in flags for name in attributes): return False
+    return command[0] != "" or "id" in flags
+
+# applies every attribute given as a flag, or asks for the one named in the command
+def editAttributes(element, label: str, attribute: str, flags: dict[str, str], attributes: dict[str, list]):
+    toChange = [name for name in attributes.keys() if name in flags] or [attribute]
+    for name in toChange:
+        prompt, columnName, columnType = attributes[name]
+        setattr(element, columnName, columnType(ask(flags, name, prompt.format(label))))
+
+# edit entry name [locationText, locationImg, count] [--id n] [--locationText text] [--locationImg file] [--count n]
+def CLIEditEntry(command):
+    command, flags = splitFlags(command)
+    if not checkEdit(command, flags, entryAttributes): 
+        raise Exception("invalid syntax, expected the name of the entry and the info you wanted to change\n('locationText', 'locationImg', or 'count')")
+    if "id" not in flags:
+        printEntries(search(Entry, command[0]))
+    toEdit = chooseId(flags, "enter the ID of the entry to edit (x to cancel): ")
+    if toEdit is None:
+        return
+    element = db.session.execute(db.select(Entry).where(Entry.id == toEdit)).scalar_one()
+    editAttributes(element, element.name, command[1] if len(command) > 1 else "", flags, entryAttributes)
+    thumbnailFor(element.locationImg)
+
+# remove entry name [--id n]
+def CLIRemoveEntry(command):
+    command, flags = splitFlags(command)
+    if command[0] == "" and "id" not in flags: raise Exception("invalid syntax, expected name of the entry")
+    if "id" not in flags:
+        printEntries(search(Entry, command[0]))
+    toDelete = chooseId(flags, "enter the ID of the entry to delete (x to cancel): ")
+    if toDelete is None:
+        return
+    # its bookings are removed by the database (ON DELETE CASCADE)
+    db.session.execute(db.delete(Entry).where(Entry.id == toDelete))
+
+# view entries [--sort column] [--desc] [--filter column=text] [--page n] [--size n] [--all]
+def CLIViewEntries(command):
+    viewTable("entries", command)
+
+
+# add booking [--material name] [--name who] [--info text]
+def CLIAddBooking(command):
+    command, flags = splitFlags(command)
+    resourceName = ask(flags, "material", "what are you booking?")
+    resource:Entry = db.session.execute(db.select(Entry).where(Entry.name == resourceName)).scalar_one_or_none()
+    if resource is None: raise Exception(f"{resourceName} not found in catalogue, please check spelling")
+    else:
+        bookee = ask(flags, "name", f"who is booking the {resourceName}? ")
+        info = ask(flags, "info", "any extra info? ")
+        try:
+            db.session.execute(db.update(Entry).where(Entry.id == resource.id).values(booked=Entry.booked + 1))
+            db.session.add(Booking(entryId=resource.id, bookedMaterial=resourceName, bookedBy=bookee, bookInfo=info))
+        except Exception as e:
+            print(f"failed to add booking\n{e}\n", file=output)
+
+# edit booking name [name, info] [--id n] [--name who] [--info text]
+def CLIEditBooking(command):
+    command, flags = splitFlags(command)
+    if not checkEdit(command, flags, bookingAttributes): 
+        raise Exception("invalid syntax, expected the name of the booking and the info you wanted to change\n('name' or 'info')")
+    if "id" not in flags:
+        printBookings(search(Booking, command[0]))
+    toEdit = chooseId(flags, "enter the ID of the entry to edit (x to cancel): ")
+    if toEdit is None:
+        return
+    element: Booking = db.session.execute(db.select(Booking).where(Booking.id == toEdit)).scalar_one()
+    editAttributes(element, element.bookedMaterial, command[1] if len(command) > 1 else "", flags, bookingAttributes)
+
+# remove booking name [--id n]
+def CLIRemoveBooking(command):
+    command, flags = splitFlags(command)
+    if command[0] == "" and "id" not in flags: raise Exception("invalid syntax, expected name of the entry")
+    if "id" not in flags:
+        printBookings(search(Booking, command[0]))
+    toDelete = chooseId(flags, "enter the ID of the booking to delete (x to cancel): ")
+    if toDelete is None:
+        return
+    element:Booking = db.session.execute(db.select(Booking).where(Booking.id == toDelete)).scalar_one()
+    if element.entryId is not None:
+        db.session.execute(db.update(Entry).where(Entry.id == element.entryId).values(booked=Entry.booked - 1))
+    db.session.delete(element)
+
+# view bookings [--sort column] [--desc] [--filter column=text] [--page n] [--size n] [--all]
+def CLIViewBookings(command):
+    viewTable("bookings", command)
+
+
+# add request material [--name who] [--info text]
+def CLIAddRequest(command):
+    command, flags = splitFlags(command)
+    # command is padded with an empty string, so we check for that instead of the length of the command
+    if command[0] == "": raise Exception("invalid syntax, expected name of the material. ")
+    else:
+        resourceName = command[0]
+        requestee = ask(flags, "name", f"who is requesting the {resourceName}? ")
+        info = ask(flags, "info", "any extra info? (links are helpful) ")
+        try:
+            db.session.add(MaterialRequest(material=resourceName, requestBy=requestee, info=info))
+        except Exception as e:
+            print(f"failed to add request\n{e}\n", file=output)
+
+# edit request name [--id n] [--info text]
+def CLIEditRequest(command):
+    command, flags = splitFlags(command)
+    if "id" not in flags:
+        printRequests(search(MaterialRequest, command[0]))
+    toEdit = chooseId(flags, "enter the ID of the request to edit (x to cancel): ")
+    if toEdit is None:
+        return
+    element: MaterialRequest = db.session.execute(db.select(MaterialRequest).where(MaterialRequest.id == toEdit)).scalar_one()
+    editAttributes(element, element.material, "info", flags, requestAttributes)
+
+# remove request name [--id n]
+def CLIRemoveRequest(command):
+    command, flags = splitFlags(command)
+    if command[0] == "" and "id" not in flags: raise Exception("invalid syntax, expected name of the request")
+    if "id" not in flags:
+        printRequests(search(MaterialRequest, command[0]))
+    toDelete = chooseId(flags, "enter the ID of the booking to delete (x to cancel): ")
+    if toDelete is None:
+        return
+    element:MaterialRequest = db.session.execute(db.select(MaterialRequest).where(MaterialRequest.id == toDelete)).scalar_one()
+    db.session.delete(element)
+
+# view requests [--sort column] [--desc] [--filter column=text] [--page n] [--size n] [--all]
+def CLIViewRequests(command):
+    viewTable("requests", command)
+
+# view archive [--sort column] [--desc] [--filter column=text] [--page n] [--size n] [--all]
+def CLIViewArchive(command):
+    viewTable("archive", command)
+
+# archive bookings [--days n] [--before YYYY-MM-DD] [--material name]
+def CLIArchiveBookings(command):
+    from archive import archiveBookings, archiveCutoff
+    command, flags = splitFlags(command)
+    # batch mode commits everything together at the end
+    archiveBookings(archiveCutoff(flags.get("before"), flags.get("days")), flags.get("material"), commit=not batchMode, out=output)
+
+
+# --- stats ---
+
+# where 'stats' looks for the server by default (flask's development server).
+# 'serve' sets app.config["SERVER_URL"] from its --bind, which an attached CLI picks up since it runs inside that server
+STATS_URL = "http://127.0.0.1:5000"
+
+def printStats(data: dict):
+    routes = data["routes"]
+    if routes:
+        print(tabulate.tabulate(
+            [[route, numbers["count"], numbers["mean"] * 1000, numbers["p50"] * 1000, numbers["p95"] * 1000, numbers["p99"] * 1000,
+              data["queriesPerRequest"][route]["mean"], data["sqlSecondsPerRequest"][route]["mean"] * 1000] for route, numbers in sorted(routes.items())],
+            ("route", "requests", "mean ms", "p50 ms", "p95 ms", "p99 ms", "queries/request", "sql ms/request"),
+            floatfmt=".1f"
+        ), "\n", file=output)
+    if data["templates"]:
+        print(tabulate.tabulate(
+            [[name, numbers["count"], numbers["mean"] * 1000, numbers["p95"] * 1000] for name, numbers in sorted(data["templates"].items())],
+            ("template", "renders", "mean ms", "p95 ms"),
+            floatfmt=".1f"
+        ), "\n", file=output)
+    print(f"{data['queries']} queries, {data['querySeconds'] * 1000:.1f} ms in total, {data['slowQueries']} slow\n", file=output)
+    for slow in data["recentSlowQueries"]:
+        print(f"  {slow['ms']:.1f} ms: {slow['statement']}", file=output)
+
+# stats [--url http://host:port]
+def CLIStats(command):
+    command, flags = splitFlags(command)
+    url = flags.get("url", current_app.config.get("SERVER_URL", STATS_URL)).rstrip("/")
+    try:
+        with urllib.request.urlopen(f"{url}/metrics?format=json", timeout=2) as response:
+            data = json.load(response)
+        print(f"numbers from the server at {url}\n", file=output)
+    except OSError as e:
+        import metrics # starts counting this CLI's own queries the first time, so a second 'stats' has more to show
+        print(f"couldn't reach the server at {url} ({e}), showing this CLI's own numbers since its first 'stats' instead\n", file=output)
+        data = metrics.summary()
+    printStats(data)
+
+# commit
+def CLICommit(command):
+    # a batch promises all or nothing, a commit halfway would leave the lines before it saved if a later one fails
+    if batchMode: raise Exception("a batch is saved in one go at the end, it can't commit partway through")
+    db.session.commit()
+
+# images [--force]
+def CLIImages(command):
+    from images import prepareImages, Image
+    command, flags = splitFlags(command)
+    if Image is None:
+        print("Pillow isn't installed, images will only be copied, not shrunk (pip install Pillow)", file=output)
+    locationImgs = db.session.execute(db.select(Entry.locationImg).distinct()).scalars().all()
+    made = prepareImages(locationImgs, force="force" in flags, out=output)
+    # cached pages still point at the old images, this makes the server render them again
+    db.session.execute(db.update(TableVersion).where(TableVersion.tableName == "entry").values(version=TableVersion.version + 1))
+    print(f"made thumbnails for {made} of {len(locationImgs)} images\n", file=output)
+
+# import [entries, requests] file [insert, upsert]
+def CLIImport(kind: str, command):
+    if command[0] == "": raise Exception(f"invalid syntax, expected import {kind} file [insert, upsert]")
+    from bulk import importRows
+    # batch mode commits everything together at the end
+    importRows(kind, command[0], command[1] or "insert", commit=not batchMode, out=output)
+
+def CLIImportEntries(command): CLIImport("entries", command)
+def CLIImportRequests(command): CLIImport("requests", command)
+
+# export [entries, bookings, requests] file
+def CLIExport(kind: str, command):
+    if command[0] == "": raise Exception(f"invalid syntax, expected export {kind} file")
+    from bulk import exportRows
+    exportRows(kind, command[0], out=output)
+
+def CLIExportEntries(command): CLIExport("entries", command)
+def CLIExportBookings(command): CLIExport("bookings", command)
+def CLIExportRequests(command): CLIExport("requests", command)
+def CLIExportArchive(command): CLIExport("archive", command)
+
+
+# commands will be called using any tokens not consumed
+# as an example: 
+#   view entry [options] only passes [options]
+#   import [options] only passes [options]
+# if something has a default option, it uses the second case
+# defaults are optional
+
+# command : {subcommand:func, "default":defaultFunc}
+# command : func
+commandTable: dict[str, dict[str, Callable] | Callable] = {
+    "add" : {"entry":CLIAddEntry, "booking":CLIAddBooking, "request":CLIAddRequest},
+    "edit" : {"entry":CLIEditEntry, "booking":CLIEditBooking, "request":CLIEditRequest},
+    "remove" : {"entry":CLIRemoveEntry, "booking":CLIRemoveBooking, "request":CLIRemoveRequest},
+    "view" : {"entries":CLIViewEntries, "bookings":CLIViewBookings, "requests":CLIViewRequests, "archive":CLIViewArchive, "default":CLIViewEntries},
+    "import" : {"entries":CLIImportEntries, "requests":CLIImportRequests},
+    "export" : {"entries":CLIExportEntries, "bookings":CLIExportBookings, "requests":CLIExportRequests, "archive":CLIExportArchive},
+    "archive" : {"bookings":CLIArchiveBookings},
+    "stats" : CLIStats,
+    "images" : CLIImages,
+    "commit" : CLICommit,
+    "clear" : (lambda _: print(u"{}[2J{}[;H".format(chr(27), chr(27)), end="", file=output)), # evil lambda statement -Kya, 2025
+}
+
+#  (both 'args' and 'description' can be empty, 
+#   this is just here to add things to the help menu. 
+#   nothing here is vital to functioning but do still 
+#   add to this when you add things)
+# command : [args, description]
+helpTable: dict[str, list[str, str]] = {
+    # hard-coded commands, dont touch unless you have a good reason
+    "help" : ["no arguments", "displays this help message"],
+    "quit" : ["no arguments", "exits the program"],
+
+    "add" : ["[entry, booking, request] name [--flags]", "manually add a row to a table, anything not given as a flag is asked for\n(entry: --locationText --locationImg --count, booking: --material --name --info, request: --name --info)"],
+    "edit" : ["[entry, booking, request] name [attribute] [--id n] [--flags]", "edits a row in a table, --id skips the search\n(entry: --locationText --locationImg --count, booking: --name --info, request: --info)"],
+    "remove" : ["[entry, booking, request] name [--id n]", "manually remove a row from a table, --id skips the search"],
+    "view" : ["[entries, bookings, requests, archive] [--sort column] [--desc] [--filter column=text] [--page n] [--size n] [--all]", "view the tables from the command line a page at a time"],
+    "import" : ["[entries, requests] file [insert, upsert]", "add rows from a .csv, .tsv or .jsonl file, upsert updates rows that already exist (commits right away)"],
+    "export" : ["[entries, bookings, requests, archive] file", "save a table to a .csv, .tsv or .jsonl file"],
+    "archive" : ["bookings [--days n] [--before YYYY-MM-DD] [--material name]", "move bookings older than --days (default ARCHIVE_AFTER_DAYS in archive.py, about half a year) or --before out of the live table into the archive ('view archive'), a batch per commit"],
+    "images" : ["[--force]", "make the small versions of every entry's location image (add, edit and import do this by themselves), --force remakes them all"],
+    "stats" : ["[--url http://host:port]", "show request times and query counts from the server (or from this CLI if it can't be reached)"],
+    "commit" : ["no arguments", "save any changes to file, making them visible to the server (attached to a server, every command is saved straight away, and a --batch file is saved at the end)"],
+    "clear" : ["no arguments", "clear the terminal"],
+}
+
+# splits what was typed into tokens. quotes group words together ("glass beaker"), 
+# but a lone apostrophe (teacher's) shouldnt break the command, so that falls back to plain spaces
+def tokenize(userInput: str) -> list[str]:
+    try:
+        return shlex.split(userInput)
+    except ValueError:
+        return userInput.split()
+
+# runs one line of input against the command table
+def runCommand(userInput: str):
+    cmd = tokenize(userInput)
+    cmd.append("") # append an empty string to pad the end, for commands that dont take args
+    if cmd[0] == "":
+        return
+    if cmd[0] not in commandTable.keys():
+        raise Exception(f"unknown command '{cmd[0]}'")
+    if type(commandTable[cmd[0]]) is dict:
+        if cmd[1] in commandTable[cmd[0]].keys():
+            commandTable[cmd[0]][cmd[1]](cmd[2:])
+        elif "default" in commandTable[cmd[0]].keys():
+            commandTable[cmd[0]]["default"](cmd[1:])
+        else:
+            raise Exception(f"expected one of: {', '.join(commandTable[cmd[0]].keys())}")
+    elif callable(commandTable[cmd[0]]):
+        try:
+            commandTable[cmd[0]](cmd[1:])
+        except TypeError:
+            commandTable[cmd[0]]()
+
+# the CLI doesnt need the website, just a bare app to hold the database connection
+def createCLIApp(config: dict | None = None) -> Flask:
+    app = Flask(__name__)
+    configureApp(app, config)
+    initApp(app)
+    return app
+
+def printHelp():
+    print(
+        tabulate.tabulate([[command, helpTable[command][0], helpTable[command][1]] for command in helpTable.keys()],
+                          headers=("", "arguments", "description"),
+                          tablefmt="simple"), "\n", file=output
+    )
+
+# one line typed into a console, local or attached to the server. quit is up to whoever is reading the lines
+def runConsoleLine(userInput: str):
+    if userInput.strip().lower() == "help":
+        printHelp()
+    else:
+        runCommand(userInput)
+
+# the CLI working on the database file by itself, used when there's no server to attach to (see admin.py). 
+# returns when the user quits
+def CLIHandler():
+    with createCLIApp().app_context():
+        while True:
+            userInput = input(" CATA > ").rstrip().lstrip()
+            if userInput.lower() == "quit":
+                return
+            try: 
+                runConsoleLine(userInput)
+            except Exception as e:
+                # unhelpful? yes. will I make it better? if I have time. 
+                print(f"something went wrong, please check your command in the help menu\nrolling back changes to SQL\n{e}\n", file=output)
+                db.session.rollback()
+
+# runs every line of a command file in one transaction, without ever asking anything. 
+# blank lines and lines starting with # are skipped. 
+# returns the exit code: 0 if everything ran and was committed, 1 if a line failed and everything was rolled back
+def runBatch(lines: Iterable[str]) -> int:
+    global batchMode
+    batchMode = True
+    with createCLIApp().app_context():
+        for lineNumber, line in enumerate(lines, start=1):
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            try:
+                runCommand(line)
+                # sends this line's changes now, so a constraint it breaks is blamed on it instead of on the commit at the end
+                db.session.flush()
+            except Exception as e:
+                db.session.rollback()
+                print(f"line {lineNumber}: {line}\n{e}\nnothing was saved", file=sys.stderr)
+                return 1
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"couldn't save the batch\n{e}\nnothing was saved", file=sys.stderr)
+            return 1
+    return 0
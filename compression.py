@@ -0,0 +1,86 @@
+# compresses pages and json on the way out, for the browsers that say they can take it (Accept-Encoding).
+# the listing pages are mostly the same few tags over and over, so they shrink to a tenth or less, which is most of
+# the wait on the school wifi. brotli is used when it's installed, gzip otherwise.
+# streamed responses are compressed a chunk at a time and flushed after every chunk, so the browser still gets
+# the top of the page while the rest of the table is being rendered
+from flask import Flask, Response, request
+import zlib
+
+try:
+    import brotli # optional, smaller than gzip for the browsers that support it
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 500 # smaller than this isnt worth it, the headers are about that big
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5 # brotli's higher settings are meant for files compressed once, not every response
+COMPRESSIBLE_TYPES = ["text/html", "text/css", "text/plain", "application/json", "application/javascript", "text/javascript"]
+
+# "br", "gzip" or None, from what the browser accepts
+def pickEncoding() -> str | None:
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+def compressBody(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzipBody(data)
+
+def gzipBody(data: bytes) -> bytes:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) # 31 means write a gzip header, not a zlib one
+    return compressor.compress(data) + compressor.flush()
+
+# compresses chunks as they come, every chunk is flushed so nothing waits in the compressor for the next one
+def compressStream(chunks, encoding: str):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+def isCompressible(response: Response) -> bool:
+    return response.mimetype in COMPRESSIBLE_TYPES
+
+# tells the response which encoding its body is in (None for plain), and any cache on the way that it depends on Accept-Encoding
+def markEncoding(response: Response, encoding: str | None):
+    response.vary.add("Accept-Encoding")
+    if encoding is not None:
+        response.content_encoding = encoding
+        response.headers.pop("Content-Length", None)
+
+def compressResponse(response: Response) -> Response:
+    # already compressed (cached pages, the files in /assets), files sent straight from disk, and empty answers like 304s
+    if response.content_encoding or response.direct_passthrough or response.status_code in [204, 304] or not isCompressible(response):
+        return response
+    if request.method == "HEAD":
+        response.vary.add("Accept-Encoding")
+        return response
+    encoding = pickEncoding()
+    if response.is_streamed:
+        if encoding is not None:
+            response.response = compressStream(response.response, encoding)
+        markEncoding(response, encoding)
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        response.vary.add("Accept-Encoding")
+        return response
+    if encoding is not None:
+        response.set_data(compressBody(data, encoding))
+    markEncoding(response, encoding)
+    return response
+
+def initCompression(app: Flask):
+    app.after_request(compressResponse)
@@ -1,9 +1,38 @@
-import manyterm
+# logging for the server.
+# whatever thread logs something only puts the record on a queue, and one listener thread writes it out
+# (to the terminal or the manyterm window, and the log files), so a request never waits on the terminal or the disk.
+# the files are json, one record per line, and roll over to a new file past LOG_FILE_BYTES.
+# access log lines (one per request) are sampled before they're even queued, see AccessSampler
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+
+try:
+    import manyterm # optional, only needed for the separate log window
+except ImportError:
+    manyterm = None
+
+LOG_FILE = "catalogue.log" # everything that's logged (and kept by the sampler)
+ERROR_FILE = "error.log" # only warnings and errors
+LOG_FILE_BYTES = 10 * 1024 * 1024 # past this a file is rotated (catalogue.log -> catalogue.log.1 -> ...)
+LOG_FILE_COUNT = 5 # rotated files kept of each
+LOG_QUEUE_SIZE = 10000 # records waiting to be written, past this new ones are dropped instead of making anyone wait
+ACCESS_SAMPLE_RATE = 0.1 # share of the access lines for requests that went fine that are kept, errors always are
+SAMPLE_RATE_VARIABLE = "CATALOGUE_ACCESS_LOG_SAMPLE" # overrides ACCESS_SAMPLE_RATE, e.g. 1 to keep every line
+ACCESS_LOGGERS = ["werkzeug"] # loggers that write one line per request
+TEXT_FORMAT = "[%(asctime)s] %(levelname)s in %(module)s: %(message)s"
 
 # used as a "stream" in the handler
 class ioOverride:
-    def __init__(self, term: manyterm.Terminal):
+    def __init__(self, term):
         self.terminal = term
     def write(self, s):
         self.terminal.print(s)
@@ -15,4 +44,146 @@ class myStreamHandler(logging.StreamHandler):
     def __init__(self, *args, **kwargs):
         # opens the new terminal
         self.flaskTerm = manyterm.Terminal()
-        super().__init__(ioOverride(self.flaskTerm), **kwargs)
\ No newline at end of file
+        super().__init__(ioOverride(self.flaskTerm), **kwargs)
+
+# the status code of an access log line, None if record isnt one.
+# werkzeug logs '"%s" %s %s' with (request line, status, size)
+def accessStatus(record: logging.LogRecord) -> int | None:
+    if record.name not in ACCESS_LOGGERS or not isinstance(record.args, tuple) or len(record.args) != 3:
+        return None
+    try:
+        return int(record.args[1])
+    except (TypeError, ValueError):
+        return None
+
+# keeps `rate` of the access lines for requests that went fine, and every line for ones that didnt (4xx, 5xx).
+# anything that isnt an access line (warnings, startup messages, our own logs) is always kept
+class AccessSampler(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        status = accessStatus(record)
+        return status is None or status >= 400 or random.random() < self.rate
+
+# one json object per line: time, level, logger, message, process, thread,
+# and the status for access lines and the traceback for exceptions
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if getattr(record, "status", None) is not None:
+            entry["status"] = record.status
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+# puts records on the queue. if the listener has fallen LOG_QUEUE_SIZE behind, records are dropped (and counted) instead of waiting
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, logQueue):
+        super().__init__(logQueue)
+        self.dropped = 0
+
+    # the message is filled in here, so the record can go to another thread (or process) without its args.
+    # everything else about how it looks is left to the listener
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record) # other handlers on the way (like gunicorn's) still get the original
+        record.status = accessStatus(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": "catalogue.logging", "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"dropped {self.dropped} log records, the log files couldn't keep up",
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# --- the pipeline ---
+
+class LogPipeline:
+    def __init__(self, sinks: list[logging.Handler], sampleRate: float):
+        self.sinks = sinks
+        self.queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.handler.addFilter(AccessSampler(sampleRate))
+        self.listeners = [logging.handlers.QueueListener(self.queue, *sinks, respect_handler_level=True)]
+        self.workerQueue = None
+
+    def start(self):
+        for listener in self.listeners:
+            listener.start()
+        atexit.register(self.stop)
+
+    # writes out whatever is still queued, then stops the listeners
+    def stop(self):
+        for listener in self.listeners:
+            listener.stop()
+        self.listeners = []
+        for sink in self.sinks:
+            sink.close()
+
+    # gunicorn forks its workers from this process, and the listener thread doesnt come along.
+    # workers send their records back here through a multiprocessing queue instead,
+    # so this process is the only one ever writing (and rotating) the files
+    def shareWithWorkers(self):
+        self.workerQueue = multiprocessing.Queue(LOG_QUEUE_SIZE)
+        listener = logging.handlers.QueueListener(self.workerQueue, *self.sinks, respect_handler_level=True)
+        listener.start()
+        self.listeners.append(listener)
+        os.register_at_fork(after_in_child=self.inWorker)
+
+    def inWorker(self):
+        self.handler.queue = self.workerQueue
+        self.listeners = [] # they stayed behind in the parent
+        self.sinks = []
+
+pipeline: LogPipeline | None = None
+
+# where records end up: the terminal (or a separate manyterm window with logWindow), catalogue.log and error.log.
+# files go in folder
+def makeSinks(logWindow: bool, folder: str) -> list[logging.Handler]:
+    if logWindow and manyterm is not None:
+        terminal = myStreamHandler()
+    else:
+        terminal = logging.StreamHandler(sys.stderr)
+    terminal.setFormatter(logging.Formatter(TEXT_FORMAT))
+    logFile = logging.handlers.RotatingFileHandler(os.path.join(folder, LOG_FILE), maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_COUNT, encoding="utf-8")
+    errorFile = logging.handlers.RotatingFileHandler(os.path.join(folder, ERROR_FILE), maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_COUNT, encoding="utf-8")
+    errorFile.setLevel(logging.WARNING)
+    for sink in [logFile, errorFile]:
+        sink.setFormatter(JSONFormatter())
+    return [terminal, logFile, errorFile]
+
+# sends everything logged in this process through the queue.
+# logWindow: show the logs in a separate manyterm window instead of this terminal (if manyterm is installed)
+def startLogging(logWindow: bool = False, folder: str = ".", sampleRate: float | None = None) -> LogPipeline:
+    global pipeline
+    if sampleRate is None:
+        sampleRate = float(os.environ.get(SAMPLE_RATE_VARIABLE, ACCESS_SAMPLE_RATE))
+    pipeline = LogPipeline(makeSinks(logWindow, folder), sampleRate)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(pipeline.handler)
+    root.setLevel(logging.INFO)
+    pipeline.start()
+    if logWindow and manyterm is None:
+        logging.getLogger("catalogue.logging").warning("manyterm isn't installed, logging to this terminal instead of a separate window")
+    return pipeline
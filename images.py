@@ -0,0 +1,199 @@
+# smaller, cacheable versions of the files in static/.
+#  - entry location images get a thumbnail (and a WebP copy for browsers that take it) when an entry is added, edited or imported
+#  - the stylesheet gets gzip (and brotli, if it's installed) copies made once when the website starts
+# everything goes into instance/assets under a name made from the file's contents, so a name never points at different
+# bytes and browsers can keep them forever (immutable). a changed file simply gets a new name
+from flask import Flask, abort, current_app, request, send_from_directory
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import TextIO
+
+try:
+    from PIL import Image, ImageOps # pip install Pillow, without it images are only copied, not shrunk
+except ImportError:
+    Image = None
+try:
+    import brotli # optional, smaller than gzip for the browsers that support it
+except ImportError:
+    brotli = None
+
+IMAGE_MAX_SIZE = 320 # thumbnails fit in a box this many pixels wide and tall
+IMAGE_SETTINGS_VERSION = 1 # bump this when the settings below change, so every thumbnail gets made again
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+IMMUTABLE = 31536000 # a year, in seconds
+PRECOMPRESSED_ASSETS = ["styling.css"] # static files templates get through assetURL()
+FALLBACK_EXTENSIONS = [".jpg", ".png", ".gif", ".svg", ".webp"] # what a thumbnail can be saved as for browsers without WebP
+
+# --- images ---
+
+def assetFolder() -> str:
+    return os.path.join(current_app.instance_path, "assets")
+
+def imageFolder() -> str:
+    return os.path.join(assetFolder(), "img")
+
+# the file in static/ that locationImg points at ("/static/shelf.png", "static/shelf.png" or just "shelf.png").
+# None for links to other sites and files that dont exist
+def sourcePath(locationImg: str) -> str | None:
+    if not locationImg or "://" in locationImg or locationImg.startswith("data:"):
+        return None
+    name = locationImg.split("?")[0].lstrip("/")
+    name = name.removeprefix(current_app.static_url_path.lstrip("/") + "/")
+    static = os.path.abspath(current_app.static_folder)
+    path = os.path.normpath(os.path.join(static, name))
+    if not path.startswith(static + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+# path : (modified time, size, hash), so a file is only read again after it changes
+imageHashes: dict[str, tuple[int, int, str]] = {}
+
+def imageHash(path: str) -> str:
+    stat = os.stat(path)
+    known = imageHashes.get(path)
+    if known and known[:2] == (stat.st_mtime_ns, stat.st_size):
+        return known[2]
+    digest = hashlib.sha256(f"{IMAGE_SETTINGS_VERSION}:{IMAGE_MAX_SIZE}:".encode())
+    with open(path, "rb") as file:
+        digest.update(file.read())
+    imageHashes[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest()[:20])
+    return imageHashes[path][2]
+
+# the thumbnail for browsers without WebP, None if it hasnt been made yet
+def fallbackFile(digest: str) -> str | None:
+    return next((digest + ext for ext in FALLBACK_EXTENSIONS if os.path.exists(os.path.join(imageFolder(), digest + ext))), None)
+
+# writes to a temporary file first, so the website never serves half a file
+def saveAtomically(target: str, save):
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(target), suffix=os.path.splitext(target)[1])
+    os.close(fd)
+    try:
+        save(temporary)
+        os.chmod(temporary, 0o644) # mkstemp makes it private, but whatever serves the site has to read it
+        os.replace(temporary, target)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+def writeFile(target: str, data: bytes):
+    def save(path: str):
+        with open(path, "wb") as file:
+            file.write(data)
+    saveAtomically(target, save)
+
+# makes the thumbnails for one location image, returns False if there was nothing to do
+def prepareImage(locationImg: str, force: bool = False) -> bool:
+    path = sourcePath(locationImg)
+    if path is None:
+        return False
+    digest = imageHash(path)
+    if not force and fallbackFile(digest) is not None:
+        return False
+    folder = imageFolder()
+    os.makedirs(folder, exist_ok=True)
+    extension = os.path.splitext(path)[1].lower()
+    # gifs can be animated and svgs are already small, those are just copied
+    if Image is None or extension in [".gif", ".svg"]:
+        extension = ".jpg" if extension == ".jpeg" else extension
+        if extension not in FALLBACK_EXTENSIONS:
+            return False
+        saveAtomically(os.path.join(folder, digest + extension), lambda target: shutil.copyfile(path, target))
+        return True
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original) # phones save photos sideways and note which way is up
+        image.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE)) # only ever shrinks
+        transparent = image.mode in ["RGBA", "LA"] or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if transparent else "RGB")
+        saveAtomically(os.path.join(folder, digest + ".webp"), lambda target: image.save(target, "WEBP", quality=WEBP_QUALITY, method=6))
+        if transparent:
+            saveAtomically(os.path.join(folder, digest + ".png"), lambda target: image.save(target, "PNG", optimize=True))
+        else:
+            saveAtomically(os.path.join(folder, digest + ".jpg"), lambda target: image.save(target, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True))
+    return True
+
+# thumbnails for a lot of location images at once, returns how many were made. images that fail are reported to out (the terminal if None)
+def prepareImages(locationImgs, force: bool = False, out: TextIO | None = None) -> int:
+    made = 0
+    for locationImg in set(locationImgs):
+        try:
+            made += prepareImage(locationImg, force)
+        except OSError as e: # not an image, or one pillow cant read
+            print(f"couldn't make a thumbnail of '{locationImg}': {e}", file=out)
+    return made
+
+# what the page should use for a location image: its thumbnail once it's been made, otherwise whatever was given
+def imageURL(locationImg: str) -> str:
+    path = sourcePath(locationImg)
+    if path is None:
+        return locationImg
+    digest = imageHash(path)
+    if fallbackFile(digest) is None:
+        return locationImg
+    return f"/assets/img/{digest}"
+
+# --- precompressed static files ---
+
+# copies the files in PRECOMPRESSED_ASSETS into the asset folder under a name with their hash in it, with gzip/brotli versions next to them
+def buildAssets(app: Flask) -> dict[str, str]:
+    folder = os.path.join(app.instance_path, "assets")
+    os.makedirs(folder, exist_ok=True)
+    urls = {}
+    for name in PRECOMPRESSED_ASSETS:
+        with open(os.path.join(app.static_folder, name), "rb") as file:
+            content = file.read()
+        stem, extension = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+        versions = {hashed: lambda: content, hashed + ".gz": lambda: gzip.compress(content, 9, mtime=0)}
+        if brotli is not None:
+            versions[hashed + ".br"] = lambda: brotli.compress(content, quality=11)
+        for fileName, compress in versions.items():
+            target = os.path.join(folder, fileName)
+            if not os.path.exists(target):
+                writeFile(target, compress())
+        urls[name] = f"/assets/{hashed}"
+    return urls
+
+# for templates: {{ assetURL('styling.css') }}
+def assetURL(name: str) -> str:
+    return current_app.extensions["assetURLs"].get(name, f"{current_app.static_url_path}/{name}")
+
+# --- serving ---
+
+# GET /assets/img/<hash> picks WebP or the fallback from what the browser accepts,
+# GET /assets/<file> sends the brotli or gzip version if the browser takes it
+def serveAsset(name: str):
+    folder = assetFolder()
+    if name.startswith("img/"):
+        digest = name.removeprefix("img/")
+        if "." in digest or "/" in digest:
+            abort(404)
+        fileName = fallbackFile(digest)
+        if request.accept_mimetypes["image/webp"] and os.path.exists(os.path.join(imageFolder(), digest + ".webp")):
+            fileName = digest + ".webp"
+        if fileName is None:
+            abort(404)
+        response = send_from_directory(imageFolder(), fileName, max_age=IMMUTABLE)
+        response.vary.add("Accept")
+    else:
+        fileName, encoding = name, None
+        for candidate, extension in [("br", ".br"), ("gzip", ".gz")]:
+            if request.accept_encodings[candidate] and os.path.exists(os.path.join(folder, name + extension)):
+                fileName, encoding = name + extension, candidate
+                break
+        mimetype = "text/css" if name.endswith(".css") else None
+        response = send_from_directory(folder, fileName, max_age=IMMUTABLE, mimetype=mimetype)
+        if encoding:
+            response.content_encoding = encoding
+        response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def initImages(app: Flask):
+    app.extensions["assetURLs"] = buildAssets(app)
+    app.jinja_env.globals["assetURL"] = assetURL
+    app.add_url_rule("/assets/<path:name>", "asset", serveAsset)
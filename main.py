@@ -1,477 +1,173 @@
-# everything exclusively for the website
-import logging.config
-from flask import Flask, render_template, redirect, url_for, current_app, request
-from markupsafe import escape
-
-# for database stuff
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-
-# moving flask's log ouput
-import logging
-from logging.config import dictConfig
+# starts the catalogue. everything else lives in its own module:
+#   models.py  - the database (tables, migrations, search)
+#   webapp.py  - the website
+#   cli.py     - the command-line interface
+#   admin.py   - how the CLI runs its commands inside the running server
+#   bulk.py    - importing/exporting tables
+# those are only imported by the commands that need them, so starting just the CLI 
+# doesnt pay for the website, and only serving opens a logging window
 
 # lets me have the input and server running at the same time
 from multiprocessing import Process
+import argparse
+import os
+import sys
 
+# --- entry point(s) ---
 
-# for the command line tool
-import tabulate
-from typing import Callable
-import subprocess
-
-#initializing all the flask sqlalchemy stuff
-class dBase(DeclarativeBase):
-    pass
-db = SQLAlchemy(model_class=dBase)
-
-class Entry(db.Model):
-    id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(unique=True)
-    locationText: Mapped[str] = mapped_column() # text description for the entry's location
-    locationImg: Mapped[str] = mapped_column() # url for the image to display on hover
-    available: Mapped[int] = mapped_column() # tracks available instances of the entry
-    booked: Mapped[int] = mapped_column() # tracks booked instances of the entry
-
-class Booking(db.Model):
-    id: Mapped[int] = mapped_column(primary_key=True)
-    bookedMaterial: Mapped[str] = mapped_column()
-    bookedBy: Mapped[str] = mapped_column()
-    bookInfo: Mapped[str] = mapped_column()
-
-class MaterialRequest(db.Model):
-    id: Mapped[int] = mapped_column(primary_key=True)
-    material: Mapped[str] = mapped_column(unique=True)
-    requestBy: Mapped[str] = mapped_column()
-    info: Mapped[str] = mapped_column()
-
-# handles the web application
-app = Flask(__name__)
-# connects the database
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///project.db"
-# initialize the db with the app
-db.init_app(app)
-
-with app.app_context():
-    # initializes the database. 
-    # if you need to undo this, delete the newly created "instance" folder. 
-    # that will delete ALL of the data stored there though, so be careful. 
-    # -Kya 2025
-    db.create_all()
-
-
-# --- pages ---
-@app.route("/")
-@app.route("/index")
-def index():
-    return render_template('index.html')
-
-@app.route("/db/")
-def lookup():
-    data: list[Entry] = db.session.execute(db.select(Entry).order_by(Entry.name)).scalars().all()
-    return render_template('dbTemplate.html', data=[[entry.name, entry.locationText, entry.locationImg, entry.available, entry.booked] for entry in data])
-
-@app.route("/db/bookings")
-def lookupBookings():
-    data: list[Booking] = db.session.execute(db.select(Booking).order_by(Booking.bookedBy)).scalars().all()
-    return render_template('bookingsTemplate.html', data=[[entry.bookedMaterial, entry.bookedBy, entry.bookInfo] for entry in data])
-
-@app.route("/book/<name>")
-def booking(name):
-    if request.args:
-        mat: Entry = db.session.execute(db.select(Entry).where(Entry.name == name)).scalar_one()
-        mat.booked += 1
-        db.session.add(Booking(bookedMaterial=name, bookedBy=request.args["name"], bookInfo=request.args["info"]))
-        db.session.commit()
-        # make page to say booking succeeded
-        return app.redirect("/Success")
-    else:
-        return render_template("bookingTemplate.html", entry=name)
-
-@app.route("/db/requests")
-def lookupRequests():
-    data: list[MaterialRequest] = db.session.execute(db.select(MaterialRequest).order_by(MaterialRequest.material)).scalars().all()
-    return render_template('requestsTemplate.html', data=[[entry.material, entry.requestBy, entry.info] for entry in data])
-
-@app.route("/request")
-def makeRequest():
-    if request.args:
-        try:
-            db.session.add(MaterialRequest(material=request.args["material"], requestBy=request.args["name"], info=request.args["info"]))
-            db.session.commit()
-            return app.redirect("/Success")
-        except Exception as e:
-            return render_template("fail.html", errorText=e.__repr__())
-    else:
-        return render_template("requestTemplate.html")
-
-@app.route("/Success")
-def success():
-    return render_template("success.html")
-
-@app.route("/contributing")
-def contributing():
-    return render_template("contributing.html")
-
-@app.errorhandler(404)
-def pageNotFound(e):
-    return render_template("404.html")
-
-# --- handling command-line input. ---
-# this will be the only way of adding things to the database for now
-
-def CLIAddEntry(command):
-    # command is padded with an empty string, so we check for that instead of the length of the command
-    if command[0] == "": raise Exception("invalid syntax, expected name of the entry. ")
-    locationText = input(f"describe the location of the '{command[0]}': ")
-    locationImg = input("enter the file name of the image showing its location: ")
-    available = int(input(f"how many '{command[0]}'s are there: "))
-    try:
-        db.session.add(Entry(name=command[0], locationText=locationText, locationImg=locationImg, available=available, booked=0))
-    except Exception as e:
-        print(f"failed to add entry, it may already exist\n{e}\n")
-
-def CLIEditEntry(command):
-    if len(command) != 2: raise Exception("invalid syntax, expected the name of the entry and the info you wanted to change\n('locationText', 'locationImg', or 'count')")
-    if command[1] not in ["locationText","locationImg","count"]: raise Exception("invalid attribute") 
-    try:
-        elements = db.session.execute(db.select(Entry).where(Entry.name.contains(command[0]))).scalars()
-        print(
-            tabulate.tabulate(
-                [[element.id, element.name, element.locationText, element.locationImg, element.available, element.booked] for element in elements], 
-                ("id", "name", "location text", "location image", "available", "booked"),
-                maxcolwidths=10
-            ), "\n"
-        )
-    except Exception as e:
-        print("no entries found\n")
-        return
-    toEdit = ""
-    while not toEdit.isdigit() and toEdit != "x":
-        toEdit = input("enter the ID of the entry to edit (x to cancel): ")
-    if toEdit == 'x':
-        return
-    else:
-        element = db.session.execute(db.select(Entry).where(Entry.id == int(toEdit))).scalar_one()
-        if command[1] == "count": element.available = int(input(f"new number of available {element.name}s: "))
-        if command[1] == "locationText": input(f"text location of {element.name}: ")
-        if command[1] == "locationImg": input(f"image location of {element.name}: ")
-
-def CLIRemoveEntry(command):
-    if command[0] == "": raise Exception("invalid syntax, expected name of the entry")
-    try:
-        elements = db.session.execute(db.select(Entry).where(Entry.name.contains(command[0]))).scalars()
-        print(
-            tabulate.tabulate(
-                [[element.id, element.name, element.locationText, element.locationImg, element.available, element.booked] for element in elements], 
-                ("id", "name", "location text", "location image", "available", "booked"),
-                maxcolwidths=10
-            ), "\n"
-        )
-    except Exception as e:
-        print(f"no entries found\n")
-        return
-
-    toDelete = ""
-    while not toDelete.isdigit() and toDelete != "x":
-        toDelete = input("enter the ID of the entry to delete (x to cancel): ")
-    if toDelete == 'x':
-        return
-    else:
-        element:Entry = db.session.execute(db.select(Entry).where(Entry.id == int(toDelete))).scalar_one()
-        db.session.execute(db.delete(Booking).where(Booking.bookedMaterial == element.name))
-        db.session.delete(element)
-
-def CLIViewEntries(command):
-    data:list[Entry] = db.session.execute(db.select(Entry).order_by(Entry.name)).scalars().all()
-    if len(data) == 0:
-        print("no entries in the database\n")
-        return
-    offset = 0
-    ENTRIES_PER_PAGE = 10
-    end=False
-    while not end:
-        print(
-            tabulate.tabulate(
-                [[element.id, element.name, element.locationText, element.locationImg, element.available, element.booked] for element in data[offset:min(offset+ENTRIES_PER_PAGE, len(data))]], 
-                ("id", "name", "location text", "location image", "available", "booked"),
-                maxcolwidths=10
-            ), "\n"
-        )
-        if len(data) < offset + ENTRIES_PER_PAGE:
-            end = True
-        else:
-            end = input(" CATA <e to end> ") == "e"
-
-
-def CLIAddBooking(command):
-    resourceName = input("what are you booking?")
-    resource:Entry = db.session.execute(db.select(Entry).where(Entry.name == resourceName)).scalar_one_or_none()
-    if resource is None: raise Exception(f"{resourceName} not found in catalogue, please check spelling")
-    else:
-        bookee = input(f"who is booking the {resourceName}? ")
-        info = input("any extra info? ")
-        try:
-            db.session.add(Booking(bookedMaterial=resourceName, bookedBy=bookee, bookInfo=info))
-        except Exception as e:
-            print(f"failed to add booking\n{e}\n")
+# logWindow: send the logs to a separate manyterm window, otherwise they go to this terminal. 
+# either way they're written by a background thread (see flaskLogger.py), and also go to catalogue.log and error.log
+def setupLogging(logWindow: bool):
+    from flaskLogger import startLogging
+    return startLogging(logWindow)
 
-def CLIEditBooking(command):
-    if len(command) != 2: raise Exception("invalid syntax, expected the name of the booking and the info you wanted to change\n('name' or 'info')")
-    if command[1] not in ["name","info"]: raise Exception("invalid attribute") 
-    try:
-        elements:list[Booking] = db.session.execute(db.select(Booking).where(Booking.bookedBy.contains(command[0]))).scalars()
-        print(
-            tabulate.tabulate(
-                [[element.id, element.bookedBy, element.bookedMaterial, element.bookInfo] for element in elements], 
-                ("id", "name", "material", "info"),
-                maxcolwidths=10
-            ), "\n"
-        )
-    except Exception as e:
-        print("no bookings found\n")
-        return
-    toEdit = ""
-    while not toEdit.isdigit() and toEdit != "x":
-        toEdit = input("enter the ID of the entry to edit (x to cancel): ")
-    if toEdit == 'x':
-        return
-    else:
-        element: Booking = db.session.execute(db.select(Booking).where(Booking.id == int(toEdit))).scalar_one()
-        if command[1] == "name": input(f"name of person booking {element.bookedMaterial}: ")
-        if command[1] == "info": input(f"info for the booking: ")
+# the development server, started next to the CLI when main.py is run without a command
+def runFlask():
+    from webapp import createApp
+    from admin import startAdmin
+    setupLogging(logWindow=True)
+    app = createApp()
+    startAdmin(app)
+    app.run()
 
-def CLIRemoveBooking(command):
-    if command[0] == "": raise Exception("invalid syntax, expected name of the entry")
+# where a server listening on bind can be reached from this machine, 0.0.0.0 listens everywhere but isnt somewhere to connect to
+def localURL(bind: str) -> str:
+    host, _, port = bind.rpartition(":")
+    if host in ["", "0.0.0.0"]:
+        host = "127.0.0.1"
+    elif host in ["::", "[::]"]:
+        host = "[::1]"
+    return f"http://{host}:{port}"
+
+# runs the same app behind a real server instead of flask's development one.
+# gunicorn forks `workers` processes that each handle `threads` requests at a time. 
+# gunicorn doesnt run on windows, so there it falls back to waitress (one process, `threads` threads). 
+# config goes to createApp (benchmark.py uses it to point the server at its scratch database)
+def runServer(bind: str, workers: int, threads: int, config: dict | None = None):
+    from webapp import createApp
+    from models import db
+    from admin import startAdmin
+    logs = setupLogging(logWindow=False)
+    # built once here, so the database is set up before any worker starts
+    app = createApp(config)
+    # for the CLI's 'stats', the config file or CATALOGUE_SERVER_URL can point it somewhere else (like a proxy in front)
+    app.config.setdefault("SERVER_URL", localURL(bind))
+    # consoles attach to this process (gunicorn's main one), the workers just serve pages
+    startAdmin(app)
     try:
-        elements: list[Booking] = db.session.execute(db.select(Booking).where(Booking.bookedBy.contains(command[0]))).scalars()
-        print(
-            tabulate.tabulate(
-                [[element.id, element.bookedBy, element.bookedMaterial, element.bookInfo] for element in elements], 
-                ("id", "name", "material", "info"),
-                maxcolwidths=10
-            ), "\n"
-        )
-    except Exception as e:
-        print(f"no entries found\n")
-        return
-        
-    toDelete = ""
-    while not toDelete.isdigit() and toDelete != "x":
-        toDelete = input("enter the ID of the booking to delete (x to cancel): ")
-    if toDelete == 'x':
-        return
-    else:
-        element:Booking = db.session.execute(db.select(Booking).where(Booking.id == int(toDelete))).scalar_one()
-        entry:Entry = db.session.execute(db.select(Entry).where(Entry.name == element.bookedMaterial)).scalar_one_or_none()
-        if entry is not None:
-            entry.booked -= 1
-        db.session.delete(element)
-
-def CLIViewBookings(command):
-    data:list[Booking] = db.session.execute(db.select(Booking).order_by(Booking.bookedMaterial)).scalars().all()
-    if len(data) == 0:
-        print("no bookings in the database\n")
-        return
-    offset = 0
-    ENTRIES_PER_PAGE = 5
-    end=False
-    while not end:
-        print(
-            tabulate.tabulate(
-                [[element.id, element.bookedBy, element.bookedMaterial, element.bookInfo] for element in data[offset:min(offset+ENTRIES_PER_PAGE, len(data))]], 
-                ("id", "name", "material", "info"),
-                maxcolwidths=10
-            ), "\n"
-        )
-        if len(data) < offset + ENTRIES_PER_PAGE:
-            end = True
-        else:
-            end = input(" CATA <e to end> ") == "e"
-
-
-def CLIAddRequest(command):
-    # command is padded with an empty string, so we check for that instead of the length of the command
-    if command[0] == "": raise Exception("invalid syntax, expected name of the material. ")
-    else:
-        resourceName = command[0]
-        requestee = input(f"who is requesting the {resourceName}? ")
-        info = input("any extra info? (links are helpful) ")
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
         try:
-            db.session.add(MaterialRequest(material=resourceName, requestBy=requestee, info=info))
-        except Exception as e:
-            print(f"failed to add request\n{e}\n")
-
-def CLIEditRequest(command):
-    try:
-        elements:list[MaterialRequest] = db.session.execute(db.select(MaterialRequest).where(MaterialRequest.material.contains(command[0]))).scalars()
-        print(
-            tabulate.tabulate(
-                [[element.id, element.material, element.requestBy, element.info] for element in elements], 
-                ("id", "material", "booked by", "info"),
-                maxcolwidths=10
-            ), "\n"
-        )
-    except Exception as e:
-        print("no requests found\n")
-        return
-    toEdit = ""
-    while not toEdit.isdigit() and toEdit != "x":
-        toEdit = input("enter the ID of the request to edit (x to cancel): ")
-    if toEdit == 'x':
+            import waitress
+        except ImportError:
+            raise SystemExit("serve needs gunicorn (linux/mac) or waitress (windows), install requirements.txt first")
+        waitress.serve(app, listen=bind, threads=threads)
         return
-    else:
-        element: MaterialRequest = db.session.execute(db.select(MaterialRequest).where(MaterialRequest.id == int(toEdit))).scalar_one()
-        info = input("replace info with: ")
-        element.info = info
 
-def CLIRemoveRequest(command):
-    if command[0] == "": raise Exception("invalid syntax, expected name of the request")
-    try:
-        elements:list[MaterialRequest] = db.session.execute(db.select(MaterialRequest).where(MaterialRequest.material.contains(command[0]))).scalars()
-        print(
-            tabulate.tabulate(
-                [[element.id, element.material, element.requestBy, element.info] for element in elements], 
-                ("id", "material", "booked by", "info"),
-                maxcolwidths=10
-            ), "\n"
-        )
-    except Exception as e:
-        print("no requests found\n")
-        return
-    toDelete = ""
-    while not toDelete.isdigit() and toDelete != "x":
-        toDelete = input("enter the ID of the booking to delete (x to cancel): ")
-    if toDelete == 'x':
-        return
+    # every worker process needs its own database connections, 
+    # the ones opened while setting up the database belong to the parent
+    def afterFork(server, worker):
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+    class CatalogueServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", bind)
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("preload_app", True) # workers are forked from the app built above
+            self.cfg.set("post_fork", afterFork)
+        def load(self):
+            return app
+
+    # gunicorn's workers log back through this process
+    logs.shareWithWorkers()
+    CatalogueServer().run()
+
+# attaches to the running server if there is one (or the one in appProc once it's up), 
+# otherwise works on the database file directly. local skips looking for a server
+def runCLI(appProc: Process | None, local: bool = False):
+    from admin import attachToServer, runConsole
+    conn = None if local else attachToServer(appProc)
+    if conn is not None:
+        runConsole(conn)
     else:
-        element:MaterialRequest = db.session.execute(db.select(MaterialRequest).where(MaterialRequest.id == int(toDelete))).scalar_one()
-        db.session.delete(element)
-
-def CLIViewRequests(command):
-    data:list[MaterialRequest] = db.session.execute(db.select(MaterialRequest).order_by(MaterialRequest.material)).scalars().all()
-    if len(data) == 0:
-        print("no requests in the database\n")
-        return
-    offset = 0
-    ENTRIES_PER_PAGE = 5
-    end=False
-    while not end:
-        print(
-            tabulate.tabulate(
-                [[element.id, element.material, element.requestBy, element.info] for element in data[offset:min(offset+ENTRIES_PER_PAGE, len(data))]], 
-                ("id", "material", "booked by", "info"),
-                maxcolwidths=10
-            ), "\n"
-        )
-        if len(data) < offset + ENTRIES_PER_PAGE:
-            end = True
-        else:
-            end = input(" CATA <e to end> ") == "e"
-
-
-# commands will be called using any tokens not consumed
-# as an example: 
-#   view entry [options] only passes [options]
-#   import [options] only passes [options]
-# if something has a default option, it uses the second case
-# defaults are optional
-
-# command : {subcommand:func, "default":defaultFunc}
-# command : func
-commandTable: dict[str, dict[str, Callable] | Callable] = {
-    "add" : {"entry":CLIAddEntry, "booking":CLIAddBooking, "request":CLIAddRequest},
-    "edit" : {"entry":CLIEditEntry, "booking":CLIEditBooking, "request":CLIEditRequest},
-    "remove" : {"entry":CLIRemoveEntry, "booking":CLIRemoveBooking, "request":CLIRemoveRequest},
-    "view" : {"entries":CLIViewEntries, "bookings":CLIViewBookings, "requests":CLIViewRequests, "default":CLIViewEntries},
-    "commit" : db.session.commit,
-    "clear" : (lambda _: print(u"{}[2J{}[;H".format(chr(27), chr(27)), end="")), # evil lambda statement -Kya, 2025
-}
-
-#  (both 'args' and 'description' can be empty, 
-#   this is just here to add things to the help menu. 
-#   nothing here is vital to functioning but do still 
-#   add to this when you add things)
-# command : [args, description]
-helpTable: dict[str, list[str, str]] = {
-    # hard-coded commands, dont touch unless you have a good reason
-    "help" : ["no arguments", "displays this help message"],
-    "quit" : ["no arguments", "exits the program"],
-
-    "add" : ["[entry, booking, request] name", "manually add a row to a table"],
-    "edit" : ["[entry, booking, request] name", "edits a row in a table"],
-    "remove" : ["[entry, booking, request] name", "manually remove a row from a table"],
-    "view" : ["[entries, bookings, requests]", "view the tables from the command line"],
-    "commit" : ["no arguments", "save any changes to file, making them visible to the server"],
-    "clear" : ["no arguments", "clear the terminal"],
-}
-
-def CLIHandler(appProc: Process):
-    with app.app_context():
-        while True:
-            userInput = input(" CATA > ").rstrip().lstrip()
-            cmd = userInput.split()
-            cmd.append("") # append an empty string to pad the end, for commands that dont take args
-            try: 
-                if userInput.lower() == "quit":
-                    print("shutting down...")
-                    print("(you may need to manually close the logging window)")
-                    appProc.kill()
-                    appProc.join()
-                    appProc.close()
-                    quit()
-                elif userInput.lower() == "help":
-                    print(
-                        tabulate.tabulate([[command, helpTable[command][0], helpTable[command][1]] for command in helpTable.keys()],
-                                          headers=("", "arguments", "description"),
-                                          tablefmt="simple"), "\n"
-                    )
-                elif cmd[0] in commandTable.keys():
-                    if type(commandTable[cmd[0]]) is dict:
-                        if cmd[1] in commandTable[cmd[0]].keys():
-                            commandTable[cmd[0]][cmd[1]](cmd[2:])
-                        elif "default" in commandTable[cmd[0]].keys():
-                            commandTable[cmd[0]]["default"](cmd[1:])
-                    elif callable(commandTable[cmd[0]]):
-                        try:
-                            commandTable[cmd[0]](cmd[1:])
-                        except Exception:
-                            commandTable[cmd[0]]()
-            except Exception as e:
-                # unhelpful? yes. will I make it better? if I have time. 
-                print(f"something went wrong, please check your command in the help menu\nrolling back changes to SQL\n{e}\n")
-                db.session.rollback()
-
-# --- entry point(s) ---
-
-def runFlask():
-    #setup logging
-    dictConfig({
-        'version': 1,
-        'formatters': {'default': {
-            'format': '[%(asctime)s] %(levelname)s in %(module)s: %(message)s',
-        }},
-        'handlers': {
-            'wsgi': {
-                'class': 'flaskLogger.myStreamHandler',
-                'formatter': 'default'
-            },
-            'file': {
-                'class': 'logging.FileHandler',
-                'filename': 'error.log',
-                'mode': 'a',
-            }},
-        'root': {
-            'level': 'INFO',
-            'handlers': ['wsgi', 'file']
-        }
-    })
-    app.run()
+        from cli import CLIHandler
+        CLIHandler()
+    print("shutting down...")
+    # appProc is None when only the CLI was started (python main.py cli)
+    if appProc is not None:
+        print("(you may need to manually close the logging window)")
+        appProc.kill()
+        appProc.join()
+        appProc.close()
+
+def runBatchFile(path: str) -> int:
+    from cli import runBatch
+    if path == "-":
+        return runBatch(sys.stdin)
+    with open(path, encoding="utf-8") as file:
+        return runBatch(file)
+
+def runImport(kind: str, path: str, mode: str):
+    from cli import createCLIApp
+    from bulk import importRows
+    with createCLIApp().app_context():
+        importRows(kind, path, mode)
+
+# for a scheduled job, e.g. cron: 0 3 * * * cd /path/to/catalogue && python main.py archive
+def runArchive(days: int | None, before: str | None):
+    from cli import createCLIApp
+    from archive import archiveBookings, archiveCutoff
+    with createCLIApp().app_context():
+        archiveBookings(archiveCutoff(before, days))
+
+def runExport(kind: str, path: str):
+    from cli import createCLIApp
+    from bulk import exportRows
+    with createCLIApp().app_context():
+        exportRows(kind, path)
 
 if __name__ == "__main__":
-    appProc = Process(target=runFlask)
-    appProc.start()
-    CLIHandler(appProc)
+    parser = argparse.ArgumentParser(description="STEM catalogue. with no command it starts the server and the CLI together")
+    parser.add_argument("--batch", metavar="FILE", help="run the CLI commands in FILE (- for stdin) in one transaction, then exit")
+    modes = parser.add_subparsers(dest="command")
+    serveArgs = modes.add_parser("serve", help="run only the web server, for actual use")
+    serveArgs.add_argument("--bind", default="0.0.0.0:8000", help="address:port to listen on")
+    serveArgs.add_argument("--workers", type=int, default=(os.cpu_count() or 1) + 1, help="number of worker processes")
+    # open catalogue pages each hold a thread for their live counts (up to AVAILABILITY_MAX_STREAMS per worker), so leave room for those
+    serveArgs.add_argument("--threads", type=int, default=16, help="requests each worker handles at once")
+    cliArgs = modes.add_parser("cli", help="run only the CLI, it attaches to a running server if there is one")
+    cliArgs.add_argument("--local", action="store_true", help="work on the database file directly even if a server is running")
+    importArgs = modes.add_parser("import", help="add rows from a .csv, .tsv or .jsonl file and exit")
+    importArgs.add_argument("kind", help="entries or requests")
+    importArgs.add_argument("file")
+    importArgs.add_argument("--mode", dest="importMode", choices=["insert", "upsert"], default="insert", help="upsert updates rows that already exist instead of skipping them")
+    exportArgs = modes.add_parser("export", help="save a table to a .csv, .tsv or .jsonl file and exit")
+    exportArgs.add_argument("kind", help="entries, bookings, requests or archive")
+    exportArgs.add_argument("file")
+    archiveArgs = modes.add_parser("archive", help="move old bookings into the archive and exit, a batch per commit")
+    archiveArgs.add_argument("--days", type=int, help="archive bookings older than this many days (default 180)")
+    archiveArgs.add_argument("--before", metavar="YYYY-MM-DD", help="archive bookings made before this date instead")
+    args = parser.parse_args()
+
+    if args.batch is not None:
+        sys.exit(runBatchFile(args.batch))
+    elif args.command == "serve":
+        runServer(args.bind, args.workers, args.threads)
+    elif args.command == "cli":
+        runCLI(None, args.local)
+    elif args.command == "import":
+        runImport(args.kind, args.file, args.importMode)
+    elif args.command == "export":
+        runExport(args.kind, args.file)
+    elif args.command == "archive":
+        runArchive(args.days, args.before)
+    else:
+        appProc = Process(target=runFlask)
+        appProc.start()
+        runCLI(appProc)
 
 # --- notes ---
 
@@ -482,4 +178,4 @@ if __name__ == "__main__":
 
 # oh yeah, when you leave a comment that isnt like... vital documentation, make sure to sign it with -[your first name], [current year]
 # this should make it a little easier to keep track of what's documentation and what's convention and stuff. 
-# -Kya, 2025
\ No newline at end of file
+# -Kya, 2025
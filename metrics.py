@@ -0,0 +1,200 @@
+# where the time goes: request latency per route, SQL queries per request, template render times and slow queries.
+# the website shows all of it at /metrics (prometheus text format, or ?format=json), and the CLI's 'stats' command prints it.
+# every process keeps its own numbers, so with several gunicorn workers each scrape only sees the worker that answered
+from flask import Flask, Response, g, has_request_context, jsonify, request, before_render_template, template_rendered
+from sqlalchemy import Engine, event
+from collections import deque
+from threading import Lock
+import logging
+import time
+
+SLOW_QUERY_MS = 100 # queries slower than this are logged, change it with app.config["SLOW_QUERY_MS"]
+slowQueryMs: float = SLOW_QUERY_MS
+RECENT_SLOW_QUERIES = 20 # how many slow queries /metrics remembers
+
+# upper bounds in seconds, the same ones prometheus uses by default
+TIME_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# queries per request, a page that needs hundreds is usually doing one query per row
+COUNT_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+logger = logging.getLogger("catalogue.metrics")
+
+class Histogram:
+    def __init__(self, buckets: list[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is everything above the biggest bucket
+        self.total = 0.0
+        self.count = 0
+        self.smallest = float("inf")
+        self.largest = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+        self.smallest = min(self.smallest, value)
+        self.largest = max(self.largest, value)
+
+    # estimates a quantile (0.95 for p95) by assuming values are spread evenly inside each bucket.
+    # kept between the smallest and largest value seen, so a route that never queries doesnt show 0.5 queries
+    def quantile(self, q: float) -> float:
+        if self.count == 0: return 0.0
+        return min(max(self.bucketQuantile(q), self.smallest), self.largest)
+
+    def bucketQuantile(self, q: float) -> float:
+        target = q * self.count
+        seen = 0
+        for i, bucketCount in enumerate(self.counts):
+            if seen + bucketCount >= target and bucketCount > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (target - seen) / bucketCount
+            seen += bucketCount
+        return self.largest
+
+# all the numbers for this process. labels are plain strings (route name, template name)
+class Registry:
+    def __init__(self):
+        self.lock = Lock()
+        self.requestSeconds: dict[str, Histogram] = {}
+        self.requestQueries: dict[str, Histogram] = {}
+        self.requestSQLSeconds: dict[str, Histogram] = {}
+        self.templateSeconds: dict[str, Histogram] = {}
+        self.statusCounts: dict[tuple[str, int], int] = {}
+        self.queries = 0
+        self.querySeconds = 0.0
+        self.slowQueries = 0
+        self.recentSlow: deque[tuple[float, str]] = deque(maxlen=RECENT_SLOW_QUERIES)
+
+    def observe(self, table: dict[str, Histogram], label: str, value: float, buckets: list[float]):
+        with self.lock:
+            if label not in table:
+                table[label] = Histogram(buckets)
+            table[label].observe(value)
+
+registry = Registry()
+
+# --- collecting ---
+
+# engine events fire for every query in this process (website and CLI alike)
+@event.listens_for(Engine, "before_cursor_execute")
+def queryStarted(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("queryStarts", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def queryFinished(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["queryStarts"].pop()
+    slow = seconds * 1000 >= slowQueryMs
+    with registry.lock:
+        registry.queries += 1
+        registry.querySeconds += seconds
+        if slow:
+            registry.slowQueries += 1
+            registry.recentSlow.append((seconds, statement))
+    if slow:
+        logger.warning("slow query (%.1f ms): %s", seconds * 1000, statement)
+    if has_request_context():
+        g.metricsQueries = g.get("metricsQueries", 0) + 1
+        g.metricsSQLSeconds = g.get("metricsSQLSeconds", 0.0) + seconds
+
+def requestStarted():
+    g.metricsStart = time.perf_counter()
+
+def requestFinished(response: Response) -> Response:
+    if "metricsStart" in g:
+        route = request.endpoint or "<not found>"
+        if response.is_streamed:
+            # a streamed page is only rendered (and its rows only read) while it's being sent, after this runs.
+            # the stream keeps the request context, so its queries still land in g, and it's counted once the server closes it
+            counted = g._get_current_object()
+            response.call_on_close(lambda: recordRequest(route, response.status_code, counted))
+        else:
+            recordRequest(route, response.status_code, g)
+    return response
+
+# counted is the request's g, kept around for streamed responses that finish after the request context is gone
+def recordRequest(route: str, status: int, counted):
+    registry.observe(registry.requestSeconds, route, time.perf_counter() - counted.metricsStart, TIME_BUCKETS)
+    registry.observe(registry.requestQueries, route, counted.get("metricsQueries", 0), COUNT_BUCKETS)
+    registry.observe(registry.requestSQLSeconds, route, counted.get("metricsSQLSeconds", 0.0), TIME_BUCKETS)
+    with registry.lock:
+        key = (route, status)
+        registry.statusCounts[key] = registry.statusCounts.get(key, 0) + 1
+
+def templateStarted(sender, template, context, **extra):
+    g.setdefault("metricsTemplateStarts", []).append(time.perf_counter())
+
+def templateFinished(sender, template, context, **extra):
+    starts = g.get("metricsTemplateStarts")
+    if starts:
+        registry.observe(registry.templateSeconds, template.name or "<string>", time.perf_counter() - starts.pop(), TIME_BUCKETS)
+
+# --- reporting ---
+
+def escapeLabel(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def histogramLines(name: str, labelName: str, table: dict[str, Histogram]) -> list[str]:
+    lines = [f"# TYPE {name} histogram"]
+    for label, histogram in sorted(table.items()):
+        labels = f'{labelName}="{escapeLabel(label)}"'
+        cumulative = 0
+        for bound, bucketCount in zip(histogram.buckets, histogram.counts):
+            cumulative += bucketCount
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+def prometheusText() -> str:
+    with registry.lock:
+        lines = histogramLines("catalogue_request_seconds", "route", registry.requestSeconds)
+        lines += histogramLines("catalogue_request_queries", "route", registry.requestQueries)
+        lines += histogramLines("catalogue_request_sql_seconds", "route", registry.requestSQLSeconds)
+        lines += histogramLines("catalogue_template_seconds", "template", registry.templateSeconds)
+        lines.append("# TYPE catalogue_responses_total counter")
+        for (route, status), count in sorted(registry.statusCounts.items()):
+            lines.append(f'catalogue_responses_total{{route="{escapeLabel(route)}",status="{status}"}} {count}')
+        lines += [
+            "# TYPE catalogue_sql_queries_total counter", f"catalogue_sql_queries_total {registry.queries}",
+            "# TYPE catalogue_sql_seconds_total counter", f"catalogue_sql_seconds_total {registry.querySeconds}",
+            "# TYPE catalogue_sql_slow_queries_total counter", f"catalogue_sql_slow_queries_total {registry.slowQueries}",
+        ]
+    return "\n".join(lines) + "\n"
+
+# the same numbers boiled down to what a person wants to read, used by ?format=json and the CLI
+def summary() -> dict:
+    def summarize(table: dict[str, Histogram]) -> dict:
+        return {label: {"count": h.count, "mean": h.total / max(h.count, 1), "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99)} for label, h in table.items()}
+    with registry.lock:
+        return {
+            "routes": summarize(registry.requestSeconds),
+            "queriesPerRequest": summarize(registry.requestQueries),
+            "sqlSecondsPerRequest": summarize(registry.requestSQLSeconds),
+            "templates": summarize(registry.templateSeconds),
+            "queries": registry.queries,
+            "querySeconds": registry.querySeconds,
+            "slowQueries": registry.slowQueries,
+            "recentSlowQueries": [{"ms": seconds * 1000, "statement": statement} for seconds, statement in registry.recentSlow],
+        }
+
+def metricsPage():
+    if request.args.get("format") == "json":
+        return jsonify(summary())
+    return Response(prometheusText(), mimetype="text/plain; version=0.0.4")
+
+# hooks everything up to the website and adds /metrics
+def initMetrics(app: Flask):
+    global slowQueryMs
+    slowQueryMs = app.config.setdefault("SLOW_QUERY_MS", SLOW_QUERY_MS)
+    app.before_request(requestStarted)
+    app.after_request(requestFinished)
+    before_render_template.connect(templateStarted, app)
+    template_rendered.connect(templateFinished, app)
+    app.add_url_rule("/metrics", "metrics", metricsPage)
@@ -0,0 +1,482 @@
+# the database: tables, migrations, search indexes and change tracking. 
+# nothing in here knows about the website or the CLI, both of them import from here
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import Index, ForeignKey, Engine, String, event, table, column, literal_column, text, make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from contextlib import contextmanager
+from typing import Callable
+import os
+import sqlite3
+import re
+import time
+import tomllib
+
+# the database is sqlite (instance/project.db) unless configured otherwise, see configureApp.
+# postgresql works too, so several web servers can share one database. 
+# anything sqlite-only in here (search indexes, triggers, PRAGMAs) says so and has a postgresql version next to it
+SUPPORTED_DATABASES = ["sqlite", "postgresql"]
+
+# case-insensitive text for sorting and comparing names. 
+# sqlite has the NOCASE collation (and indexes built on it), other databases compare lower() of the text instead
+class Caseless(FunctionElement):
+    name = "caseless"
+    type = String()
+    inherit_cache = True
+
+@compiles(Caseless)
+def compileCaseless(element, compiler, **kw):
+    return f"lower({compiler.process(element.clauses, **kw)})"
+
+@compiles(Caseless, "sqlite")
+def compileCaselessSQLite(element, compiler, **kw):
+    return f"{compiler.process(element.clauses, **kw)} COLLATE NOCASE"
+
+#initializing all the flask sqlalchemy stuff
+class dBase(DeclarativeBase):
+    pass
+db = SQLAlchemy(model_class=dBase)
+
+class Entry(db.Model):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(unique=True)
+    locationText: Mapped[str] = mapped_column() # text description for the entry's location
+    locationImg: Mapped[str] = mapped_column() # url for the image to display on hover
+    available: Mapped[int] = mapped_column() # tracks available instances of the entry
+    booked: Mapped[int] = mapped_column() # tracks booked instances of the entry
+
+# case-insensitive (name, id) index, this is what the /api/entries search and pagination walk.
+# prefix searches (LIKE 'abc%') and the keyset cursor both turn into range scans on it
+Index("ix_entry_name_nocase", Caseless(Entry.name), Entry.id)
+
+class Booking(db.Model):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # the booked entry. deleting the entry deletes its bookings too.
+    # can be empty for old bookings whose entry was already gone when this column was added
+    entryId: Mapped[int | None] = mapped_column(ForeignKey("entry.id", ondelete="CASCADE"), index=True)
+    bookedMaterial: Mapped[str] = mapped_column() # name of the entry, kept so the bookings page doesnt need a join
+    bookedBy: Mapped[str] = mapped_column()
+    bookInfo: Mapped[str] = mapped_column()
+    # unix time the booking was made, filled in by sqlalchemy for every insert (the website's and the CLI's). 
+    # empty for bookings from before this column was added
+    bookedAt: Mapped[int | None] = mapped_column(default=lambda: int(time.time()))
+
+# archiving (archive.py) looks for the oldest bookings
+Index("ix_booking_booked_at", Booking.bookedAt)
+
+# bookings moved out of booking by archiving (see archive.py), so the live table only holds the current ones. 
+# no foreign key to entry: history stays even if the entry is removed later
+class BookingArchive(db.Model):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    bookingId: Mapped[int] = mapped_column() # the id it had in booking (sqlite can hand that id out again afterwards)
+    entryId: Mapped[int | None] = mapped_column()
+    bookedMaterial: Mapped[str] = mapped_column()
+    bookedBy: Mapped[str] = mapped_column()
+    bookInfo: Mapped[str] = mapped_column()
+    bookedAt: Mapped[int | None] = mapped_column()
+    archivedAt: Mapped[int] = mapped_column() # unix time
+
+class MaterialRequest(db.Model):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    material: Mapped[str] = mapped_column(unique=True)
+    requestBy: Mapped[str] = mapped_column()
+    info: Mapped[str] = mapped_column()
+
+# one row per tracked table, bumped by triggers every time a row in that table changes (see createVersionTriggers)
+class TableVersion(db.Model):
+    tableName: Mapped[str] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(default=0)
+    changedAt: Mapped[int] = mapped_column(default=0) # unix time of the last change
+
+# one row per change to an entry (added, removed, or its counts changed), written by triggers (see createChangeLogTriggers). 
+# only the newest CHANGE_LOG_ROWS are kept. the website follows it to push new counts to open pages
+class EntryChange(db.Model):
+    seq: Mapped[int] = mapped_column(primary_key=True)
+    entryId: Mapped[int] = mapped_column()
+
+# --- demand rollups ---
+# running totals for the analytics page (analytics.py), kept up to date by triggers on every booking and request 
+# (see createRollupTriggers), so the page reads a few small tables instead of counting years of bookings. 
+# they only ever count up: removing a booking later doesnt take it back out of the demand it showed
+
+# bookings per material per day. day is days since 1970 in UTC, 0 for bookings made before bookedAt existed
+class BookingDaily(db.Model):
+    material: Mapped[str] = mapped_column(primary_key=True)
+    day: Mapped[int] = mapped_column(primary_key=True)
+    bookings: Mapped[int] = mapped_column(default=0)
+
+# "most booked lately" adds up one range of days across every material, straight from the index
+Index("ix_booking_daily_day", BookingDaily.day, BookingDaily.material, BookingDaily.bookings)
+
+# bookings per day with every material added together, what the timeline shows
+class BookingDayTotal(db.Model):
+    day: Mapped[int] = mapped_column(primary_key=True)
+    bookings: Mapped[int] = mapped_column(default=0)
+
+# bookings per material, all time
+class BookingTotal(db.Model):
+    material: Mapped[str] = mapped_column(primary_key=True)
+    bookings: Mapped[int] = mapped_column(default=0, index=True)
+    lastDay: Mapped[int] = mapped_column(default=0) # newest day in booking_daily for this material
+
+# how many times each material has been asked for. 
+# material_request only keeps the first ask, asking again for the same thing is counted here (see addRequest in writes.py)
+class RequestDemand(db.Model):
+    material: Mapped[str] = mapped_column(primary_key=True)
+    asks: Mapped[int] = mapped_column(default=0)
+    lastAskedAt: Mapped[int] = mapped_column(default=0) # unix time, 0 for asks from before this table existed
+
+Index("ix_request_demand_asks", RequestDemand.asks, RequestDemand.lastAskedAt)
+
+# how many of the migrations below this database has had, always one row
+class SchemaVersion(db.Model):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column()
+
+SQLITE_BUSY_TIMEOUT_MS = 5000 # how long a write waits for the database lock before giving up
+
+# settings sqlite wants on every new connection
+#  - foreign_keys: off by default, without it the ON DELETE CASCADE on bookings does nothing
+#  - journal_mode=WAL: readers (the website) dont block on a writer (the CLI) and the other way around
+#  - synchronous=NORMAL: safe with WAL, and commits dont have to wait on a full disk sync
+#  - busy_timeout: wait for a lock instead of failing straight away when the server and CLI write at once
+@event.listens_for(Engine, "connect")
+def setSQLitePragmas(dbapiConnection, connectionRecord):
+    if isinstance(dbapiConnection, sqlite3.Connection):
+        cursor = dbapiConnection.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+# --- migrations ---
+# create_all only makes tables that are missing, it never changes ones that already exist. 
+# so any change to an existing table needs a function here that updates older databases in place. 
+# they run in order, once each, and the database remembers how many have run in schema_version. 
+# never edit or reorder old ones, only add new ones to the end. 
+# write them so they run on every database in SUPPORTED_DATABASES (plain ALTER TABLE, quoted camelCase names)
+
+def migrateBookingEntryId(conn):
+    conn.execute(text('ALTER TABLE booking ADD COLUMN "entryId" INTEGER REFERENCES entry (id) ON DELETE CASCADE'))
+    conn.execute(text('UPDATE booking SET "entryId" = (SELECT entry.id FROM entry WHERE entry.name = booking."bookedMaterial")'))
+
+# the rollup tables were just made by create_all, fill them from what's already there. 
+# nobody knows when the older bookings were made, so they all go under day 0
+def migrateDemandRollups(conn):
+    conn.execute(text('ALTER TABLE booking ADD COLUMN "bookedAt" INTEGER'))
+    conn.execute(text('INSERT INTO booking_daily (material, day, bookings) SELECT "bookedMaterial", 0, count(*) FROM booking GROUP BY "bookedMaterial"'))
+    conn.execute(text('INSERT INTO booking_total (material, bookings, "lastDay") SELECT "bookedMaterial", count(*), 0 FROM booking GROUP BY "bookedMaterial"'))
+    conn.execute(text('INSERT INTO booking_day_total (day, bookings) SELECT 0, count(*) FROM booking HAVING count(*) > 0'))
+    conn.execute(text('INSERT INTO request_demand (material, asks, "lastAskedAt") SELECT material, 1, 0 FROM material_request'))
+
+migrations: list[Callable] = [
+    migrateBookingEntryId,
+    migrateDemandRollups,
+]
+
+# fresh is True when create_all just made the tables, they already match the models so nothing needs to run
+def migrateDatabase(fresh: bool):
+    with db.engine.begin() as conn:
+        version = conn.execute(db.select(SchemaVersion.version)).scalar()
+        if version is None:
+            # sqlite databases from before schema_version kept the count in PRAGMA user_version. 
+            # any other database can only have been made by code that already had every migration
+            if not fresh and conn.dialect.name == "sqlite":
+                version = conn.execute(text("PRAGMA user_version")).scalar()
+            else:
+                version = len(migrations)
+            conn.execute(db.insert(SchemaVersion).values(id=1, version=version))
+        for migration in migrations[version:]:
+            migration(conn)
+        conn.execute(db.update(SchemaVersion).values(version=len(migrations)))
+
+# --- full-text search ---
+# SQLite FTS5 indexes over the text columns people actually search by. 
+# they use "external content", so the text isnt stored twice, and triggers keep them in sync 
+# with their table no matter who writes to it (the server, the CLI, or some sqlite browser). 
+# other databases dont get an index, search there is a plain case-insensitive match on the same columns (see wordFilter)
+
+# fts table : [content table, model, indexed columns (first one is the one that matters most)]
+searchTables: dict[str, list] = {
+    "entry_fts" : ["entry", Entry, ["name", "locationText"]],
+    "booking_fts" : ["booking", Booking, ["bookedBy", "bookedMaterial", "bookInfo"]],
+    "booking_archive_fts" : ["booking_archive", BookingArchive, ["bookedBy", "bookedMaterial", "bookInfo"]],
+    "material_request_fts" : ["material_request", MaterialRequest, ["material", "info"]],
+}
+
+def searchIndexDDL(ftsName: str, tableName: str, columns: list[str]) -> list[str]:
+    cols = ", ".join(f'"{c}"' for c in columns)
+    newCols = ", ".join(f'new."{c}"' for c in columns)
+    oldCols = ", ".join(f'old."{c}"' for c in columns)
+    return [
+        # prefix='2 3' keeps short prefix queries (what people type into a search box) fast
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {ftsName} USING fts5({cols}, content='{tableName}', content_rowid='id', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {ftsName}_ai AFTER INSERT ON {tableName} BEGIN "
+        f"INSERT INTO {ftsName}(rowid, {cols}) VALUES (new.id, {newCols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {ftsName}_ad AFTER DELETE ON {tableName} BEGIN "
+        f"INSERT INTO {ftsName}({ftsName}, rowid, {cols}) VALUES ('delete', old.id, {oldCols}); END",
+        # only fires for the indexed columns, so bumping counters doesnt touch the index
+        f"CREATE TRIGGER IF NOT EXISTS {ftsName}_au AFTER UPDATE OF {cols} ON {tableName} BEGIN "
+        f"INSERT INTO {ftsName}({ftsName}, rowid, {cols}) VALUES ('delete', old.id, {oldCols}); "
+        f"INSERT INTO {ftsName}(rowid, {cols}) VALUES (new.id, {newCols}); END",
+    ]
+
+def createSearchIndexes():
+    if db.engine.dialect.name != "sqlite":
+        return
+    with db.engine.begin() as conn:
+        for ftsName, (tableName, model, columns) in searchTables.items():
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": ftsName}).first()
+            for statement in searchIndexDDL(ftsName, tableName, columns):
+                conn.execute(text(statement))
+            if not exists:
+                # fill the index from whatever is already in the table
+                conn.execute(text(f"INSERT INTO {ftsName}({ftsName}) VALUES ('rebuild')"))
+                # weight matches in the first column higher than the rest
+                weights = ", ".join(["10.0"] + ["1.0"] * (len(columns) - 1))
+                conn.execute(text(f"INSERT INTO {ftsName}({ftsName}, rank) VALUES ('rank', 'bm25({weights})')"))
+
+# turns whatever the user typed into an FTS5 query where every word is a prefix match.
+# words are quoted so things like "-", "*" or "OR" in the input are never treated as query syntax
+def searchQuery(userText: str) -> str:
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", userText))
+
+# the fts table and indexed columns for a model
+def searchIndexFor(model) -> tuple[str, list[str]]:
+    return next((name, columns) for name, (_, m, columns) in searchTables.items() if m is model)
+
+# without an FTS5 index: every word has to be somewhere in one of the columns, ignoring case
+def wordFilter(columns: list, userText: str):
+    words = [word.replace("_", "\\_") for word in re.findall(r"\w+", userText)] # _ is a LIKE wildcard
+    return db.and_(*[db.or_(*[col.ilike(f"%{word}%", escape="\\") for col in columns]) for word in words])
+
+def hasSearchIndexes() -> bool:
+    return db.engine.dialect.name == "sqlite"
+
+# rows of model matching userText, best match first. 
+# if there's nothing to search for, every row is returned (same as .contains("") used to)
+def search(model, userText: str, limit: int | None = None, offset: int = 0) -> list:
+    ftsName, columns = searchIndexFor(model)
+    query = searchQuery(userText)
+    if query and not hasSearchIndexes():
+        # no ranking here, matches just come in the order they were added
+        select = db.select(model).where(wordFilter([getattr(model, name) for name in columns], userText)).order_by(model.id)
+    elif query:
+        fts = table(ftsName, column("rowid"), column("rank"))
+        select = db.select(model).join(fts, fts.c.rowid == model.id).where(literal_column(ftsName).op("MATCH")(query)).order_by(fts.c.rank)
+    else:
+        select = db.select(model).order_by(model.id)
+    return db.session.execute(select.limit(limit).offset(offset)).scalars().all()
+
+# a where clause for rows of model whose columnName (one of the indexed ones) matches userText. 
+# unlike search() this doesnt rank anything, so it can be combined with any other query and ordering
+def searchFilter(model, columnName: str, userText: str):
+    if not hasSearchIndexes():
+        return wordFilter([getattr(model, columnName)], userText)
+    ftsName, _ = searchIndexFor(model)
+    query = f"{{{columnName}}} : ({searchQuery(userText)})"
+    return model.id.in_(db.select(literal_column("rowid")).select_from(table(ftsName)).where(literal_column(ftsName).op("MATCH")(query)))
+
+
+# --- change tracking ---
+# the server caches pages until the data behind them changes (see cachedPage in webapp.py). 
+# the CLI runs in another process, so instead of telling the server about changes 
+# every write bumps a counter in table_version through a trigger, and the server just reads the counters
+
+versionedTables: list[str] = ["entry", "booking", "booking_archive", "material_request"]
+
+def versionTriggerDDL(dialect: str, tableName: str) -> list[str]:
+    if dialect == "postgresql":
+        # one trigger function for every table, run once per statement instead of once per row
+        return [
+            "CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$ BEGIN "
+            "UPDATE table_version SET version = version + 1, \"changedAt\" = CAST(extract(epoch FROM now()) AS INTEGER) "
+            "WHERE \"tableName\" = TG_TABLE_NAME; RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"CREATE OR REPLACE TRIGGER {tableName}_version AFTER INSERT OR UPDATE OR DELETE ON {tableName} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+        ]
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {tableName}_version_{action.lower()} AFTER {action} ON {tableName} BEGIN "
+        f"UPDATE table_version SET version = version + 1, \"changedAt\" = CAST(strftime('%s', 'now') AS INTEGER) "
+        f"WHERE \"tableName\" = '{tableName}'; END"
+        for action in ["INSERT", "UPDATE", "DELETE"]
+    ]
+
+def createVersionTriggers():
+    with db.engine.begin() as conn:
+        known = set(conn.execute(db.select(TableVersion.tableName)).scalars())
+        for tableName in versionedTables:
+            if tableName not in known:
+                conn.execute(db.insert(TableVersion).values(tableName=tableName, version=0, changedAt=0))
+            for statement in versionTriggerDDL(conn.dialect.name, tableName):
+                conn.execute(text(statement))
+
+# {table name : (version, changedAt)} in one query
+def tableVersions(tableNames: list[str]) -> dict[str, tuple[int, int]]:
+    rows = db.session.execute(db.select(TableVersion).where(TableVersion.tableName.in_(tableNames))).scalars()
+    return {row.tableName: (row.version, row.changedAt) for row in rows}
+
+# the versions only say *that* a table changed. for entries the website also needs to know *which* rows did, 
+# so open pages can be told the new counts, so entry changes are also logged to entry_change by id
+CHANGE_LOG_ROWS = 10000 # anyone further behind than this has to reload everything
+ENTRY_CHANGE_LOCK = 7301 # postgresql advisory lock ids, any number nothing else on the server uses
+SCHEMA_LOCK = 7302
+
+def changeLogTriggerDDL(dialect: str) -> list[str]:
+    prune = f"DELETE FROM entry_change WHERE seq <= (SELECT max(seq) FROM entry_change) - {CHANGE_LOG_ROWS};"
+    if dialect == "postgresql":
+        # sqlite has one writer at a time, so seqs become visible in order. postgresql hands out seqs before commit, 
+        # and a page could see seq 11 while 10 is still uncommitted and never look at 10 again. 
+        # the lock makes transactions that change entries commit one after the other, like sqlite
+        return [
+            "CREATE OR REPLACE FUNCTION log_entry_change() RETURNS trigger AS $$ BEGIN "
+            f"PERFORM pg_advisory_xact_lock({ENTRY_CHANGE_LOCK}); "
+            "INSERT INTO entry_change (\"entryId\") VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END); "
+            f"{prune} RETURN NULL; END $$ LANGUAGE plpgsql",
+            "CREATE OR REPLACE TRIGGER entry_change_insert AFTER INSERT OR DELETE ON entry FOR EACH ROW EXECUTE FUNCTION log_entry_change()",
+            "CREATE OR REPLACE TRIGGER entry_change_update AFTER UPDATE OF available, booked ON entry FOR EACH ROW EXECUTE FUNCTION log_entry_change()",
+        ]
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS entry_change_{name} AFTER {action} ON entry BEGIN "
+        f"INSERT INTO entry_change (\"entryId\") VALUES ({row}.id); {prune} END"
+        for name, action, row in [("insert", "INSERT", "new"), ("update", "UPDATE OF available, booked", "new"), ("delete", "DELETE", "old")]
+    ]
+
+def createChangeLogTriggers():
+    with db.engine.begin() as conn:
+        for statement in changeLogTriggerDDL(conn.dialect.name):
+            conn.execute(text(statement))
+
+# the newest change, pages remember this so they know which changes they havent seen
+def latestEntryChange(conn=None) -> int:
+    return (conn or db.session).execute(db.select(db.func.max(EntryChange.seq))).scalar() or 0
+
+# every entry changed after seq, with its counts as of the returned seq ({id : (available, booked)}, None if it was removed). 
+# the changes are None if the log doesnt go back that far anymore
+def entryChangesSince(conn, seq: int) -> tuple[int, dict[int, tuple[int, int] | None] | None]:
+    latest, oldest = conn.execute(db.select(db.func.max(EntryChange.seq), db.func.min(EntryChange.seq))).one()
+    if latest is None or latest <= seq:
+        return seq, {}
+    if oldest > seq + 1:
+        return latest, None
+    rows = conn.execute(
+        db.select(EntryChange.entryId, Entry.available, Entry.booked).distinct()
+        .outerjoin(Entry, Entry.id == EntryChange.entryId)
+        .where(EntryChange.seq > seq, EntryChange.seq <= latest)
+    )
+    return latest, {entryId: None if available is None else (available, booked) for entryId, available, booked in rows}
+
+# --- demand rollup triggers ---
+# every booking adds one to its material's day and total and to the day's total, every new request adds one ask. 
+# both are upserts, the first booking of a material on a day makes its row
+
+SECONDS_PER_DAY = 86400
+
+def rollupTriggerDDL(dialect: str) -> list[str]:
+    if dialect == "postgresql":
+        day = f'coalesce(NEW."bookedAt" / {SECONDS_PER_DAY}, 0)'
+        return [
+            "CREATE OR REPLACE FUNCTION rollup_booking() RETURNS trigger AS $$ BEGIN "
+            f'INSERT INTO booking_daily (material, day, bookings) VALUES (NEW."bookedMaterial", {day}, 1) '
+            "ON CONFLICT (material, day) DO UPDATE SET bookings = booking_daily.bookings + 1; "
+            f'INSERT INTO booking_total (material, bookings, "lastDay") VALUES (NEW."bookedMaterial", 1, {day}) '
+            'ON CONFLICT (material) DO UPDATE SET bookings = booking_total.bookings + 1, "lastDay" = greatest(booking_total."lastDay", excluded."lastDay"); '
+            f"INSERT INTO booking_day_total (day, bookings) VALUES ({day}, 1) ON CONFLICT (day) DO UPDATE SET bookings = booking_day_total.bookings + 1; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            "CREATE OR REPLACE TRIGGER booking_rollup AFTER INSERT ON booking FOR EACH ROW EXECUTE FUNCTION rollup_booking()",
+            "CREATE OR REPLACE FUNCTION rollup_request() RETURNS trigger AS $$ BEGIN "
+            'INSERT INTO request_demand (material, asks, "lastAskedAt") VALUES (NEW.material, 1, CAST(extract(epoch FROM now()) AS INTEGER)) '
+            'ON CONFLICT (material) DO UPDATE SET asks = request_demand.asks + 1, "lastAskedAt" = excluded."lastAskedAt"; '
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            "CREATE OR REPLACE TRIGGER material_request_rollup AFTER INSERT ON material_request FOR EACH ROW EXECUTE FUNCTION rollup_request()",
+        ]
+    day = f'coalesce(new."bookedAt" / {SECONDS_PER_DAY}, 0)'
+    return [
+        "CREATE TRIGGER IF NOT EXISTS booking_rollup AFTER INSERT ON booking BEGIN "
+        f'INSERT INTO booking_daily (material, day, bookings) VALUES (new."bookedMaterial", {day}, 1) '
+        "ON CONFLICT (material, day) DO UPDATE SET bookings = booking_daily.bookings + 1; "
+        f'INSERT INTO booking_total (material, bookings, "lastDay") VALUES (new."bookedMaterial", 1, {day}) '
+        'ON CONFLICT (material) DO UPDATE SET bookings = booking_total.bookings + 1, "lastDay" = max(booking_total."lastDay", excluded."lastDay"); '
+        f"INSERT INTO booking_day_total (day, bookings) VALUES ({day}, 1) ON CONFLICT (day) DO UPDATE SET bookings = booking_day_total.bookings + 1; END",
+        "CREATE TRIGGER IF NOT EXISTS material_request_rollup AFTER INSERT ON material_request BEGIN "
+        "INSERT INTO request_demand (material, asks, \"lastAskedAt\") VALUES (new.material, 1, CAST(strftime('%s', 'now') AS INTEGER)) "
+        'ON CONFLICT (material) DO UPDATE SET asks = request_demand.asks + 1, "lastAskedAt" = excluded."lastAskedAt"; END',
+    ]
+
+def createRollupTriggers():
+    with db.engine.begin() as conn:
+        for statement in rollupTriggerDDL(conn.dialect.name):
+            conn.execute(text(statement))
+
+# --- setup ---
+
+DATABASE_URI = "sqlite:///project.db"
+CONFIG_FILE = "config.toml" # in the instance folder, optional
+ENV_PREFIX = "CATALOGUE" # CATALOGUE_SQLALCHEMY_DATABASE_URI=postgresql+psycopg://... and so on
+
+# connection pools for database servers. a sqlite file doesnt need one tuned, connecting to it is just opening a file
+#  - pool_size/max_overflow: connections each process keeps open, and how many more it may open when busy. 
+#    every gunicorn worker has its own pool, so workers * servers * (pool_size + max_overflow) has to fit in the database's max_connections
+#  - pool_pre_ping: checks a connection still works before using it, database servers and firewalls drop idle ones
+#  - pool_recycle: seconds before a connection is replaced anyway, before anything in between gives up on it
+#  - pool_timeout: seconds a request waits for a free connection before failing
+SERVER_POOL_OPTIONS = {"pool_size": 5, "max_overflow": 15, "pool_pre_ping": True, "pool_recycle": 1800, "pool_timeout": 10}
+
+# settings come from, lowest priority first: instance/config.toml, CATALOGUE_* environment variables, then config (what the benchmark passes in). 
+# environment values are read as json where they can be, and CATALOGUE_SQLALCHEMY_ENGINE_OPTIONS__pool_size=20 sets a single engine option
+def configureApp(app: Flask, config: dict | None = None):
+    app.config.from_file(os.path.join(app.instance_path, CONFIG_FILE), load=tomllib.load, text=False, silent=True)
+    app.config.from_prefixed_env(ENV_PREFIX)
+    app.config.update(config or {})
+
+# connects the database to a flask app and makes sure the tables are up to date. 
+# both the website and the CLI go through this, the database only exists inside an app context
+def initApp(app: Flask):
+    uri = app.config.setdefault("SQLALCHEMY_DATABASE_URI", DATABASE_URI)
+    backend = make_url(uri).get_backend_name()
+    if backend not in SUPPORTED_DATABASES:
+        raise Exception(f"can't use a {backend} database, only {' or '.join(SUPPORTED_DATABASES)}")
+    if backend != "sqlite":
+        # anything set in the config wins over these
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = SERVER_POOL_OPTIONS | app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    db.init_app(app)
+    with app.app_context(), schemaLock():
+        initDatabase()
+
+# several servers starting at once against one database would all try to make the same tables and triggers. 
+# on postgresql they take turns, sqlite files are only ever set up by the one machine they're on
+@contextmanager
+def schemaLock():
+    if db.engine.dialect.name != "postgresql":
+        yield
+        return
+    with db.engine.connect() as conn:
+        conn.execute(text(f"SELECT pg_advisory_lock({SCHEMA_LOCK})"))
+        conn.commit() # the lock belongs to the connection, not the transaction
+        try:
+            yield
+        finally:
+            conn.execute(text(f"SELECT pg_advisory_unlock({SCHEMA_LOCK})"))
+            conn.commit()
+
+def initDatabase():
+    # initializes the database. 
+    # if you need to undo this, delete the newly created "instance" folder. 
+    # that will delete ALL of the data stored there though, so be careful. 
+    # -Kya 2025
+    fresh = not db.inspect(db.engine).has_table(Entry.__tablename__)
+    db.create_all()
+    migrateDatabase(fresh)
+    # create_all skips tables that already exist, including their indexes, 
+    # so make sure indexes added later also end up in older databases
+    for dbTable in db.metadata.sorted_tables:
+        for index in dbTable.indexes:
+            index.create(db.engine, checkfirst=True)
+    createSearchIndexes()
+    createVersionTriggers()
+    createChangeLogTriggers()
+    createRollupTriggers()
@@ -0,0 +1,356 @@
+# everything exclusively for the website
+from flask import Flask, Blueprint, render_template, stream_template, redirect, request, jsonify, make_response
+from sqlalchemy import or_
+from typing import Callable
+
+# for caching pages
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+import hashlib
+import time
+
+from models import db, initApp, configureApp, Caseless, Entry, Booking, BookingArchive, MaterialRequest, search, tableVersions, latestEntryChange
+from metrics import initMetrics
+from writes import initWriteQueue, queuedWrite, addBooking, addRequest
+from availability import initAvailability
+from images import initImages, imageURL
+from compression import initCompression, pickEncoding, compressBody, compressStream, markEncoding
+from analytics import initAnalytics
+
+# --- page cache ---
+# rendered pages are kept in memory until one of the tables they show changes. 
+# browsers get an ETag built from the table versions, so asking again for a page 
+# that hasnt changed is answered with a 304 before anything is queried or rendered
+
+MAX_CACHED_PAGES = 64
+MAX_CACHED_BYTES = 32 * 1024 * 1024
+
+# different every time the server starts, so new code or templates never match an old ETag
+CACHE_SALT = str(time.time())
+
+class PageCache:
+    def __init__(self, maxPages: int, maxBytes: int):
+        self.maxPages = maxPages
+        self.maxBytes = maxBytes
+        self.pages: OrderedDict[tuple, bytes] = OrderedDict()
+        self.size = 0
+        self.lock = Lock() # threaded servers share one cache per process
+    
+    def get(self, key: tuple) -> bytes | None:
+        with self.lock:
+            body = self.pages.get(key)
+            if body is not None:
+                self.pages.move_to_end(key)
+            return body
+    
+    def put(self, key: tuple, body: bytes):
+        with self.lock:
+            if key in self.pages:
+                self.size -= len(self.pages.pop(key))
+            self.pages[key] = body
+            self.size += len(body)
+            # throw out the least recently used pages until we fit again
+            while len(self.pages) > self.maxPages or self.size > self.maxBytes:
+                _, oldBody = self.pages.popitem(last=False)
+                self.size -= len(oldBody)
+    
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.size = 0
+
+pageCache = PageCache(MAX_CACHED_PAGES, MAX_CACHED_BYTES)
+
+STREAM_CHUNK_BYTES = 16 * 1024 # streamed pages are sent in pieces about this big
+STREAM_ROWS = 500 # rows fetched from the database at a time for streamed pages
+
+# joins the tiny pieces a streamed template yields into bigger ones, so every piece isnt its own write (and its own flush when compressed)
+def bufferChunks(chunks, size: int = STREAM_CHUNK_BYTES):
+    buffered, length = [], 0
+    for chunk in chunks:
+        data = chunk.encode() if isinstance(chunk, str) else chunk
+        buffered.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(buffered)
+            buffered, length = [], 0
+    if buffered:
+        yield b"".join(buffered)
+
+# rows for a streamed page, read from the database while the page is sent so the top of it doesnt wait for the whole table.
+# the query only runs once the template gets to it: flask has already closed the view's session by the time a stream starts,
+# and a half-read cursor on a connection that's back in the pool keeps an old snapshot open for whoever gets it next
+def streamRows(query):
+    result = db.session.execute(query.execution_options(yield_per=STREAM_ROWS))
+    try:
+        yield from result
+    finally:
+        result.close() # the browser went away halfway
+
+# sends a streamed page on while keeping a copy, which goes into the cache once the whole page has been sent.
+# if the browser goes away halfway nothing is cached
+def teeIntoCache(chunks, cacheKey: tuple):
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    pageCache.put(cacheKey, b"".join(sent))
+
+# caches a page until any of tableNames changes. only use this on pages that show the same thing to everyone.
+# pages are cached already compressed, one copy per encoding, so a cached page is never compressed twice.
+# views can return stream_template(...), the first visitor then gets the page as it's rendered
+def cachedPage(*tableNames: str):
+    def decorator(view: Callable):
+        @wraps(view)
+        def cached(*args, **kwargs):
+            versions = tableVersions(list(tableNames))
+            key = (request.full_path, tuple(versions[name][0] for name in tableNames))
+            encoding = pickEncoding()
+            etag = hashlib.sha1(repr((CACHE_SALT, key, encoding)).encode()).hexdigest()
+            
+            response = None
+            # only bother with the cache when the browser doesnt already have this exact page
+            if etag not in request.if_none_match:
+                body = pageCache.get((key, encoding))
+                if body is not None:
+                    response = make_response(body)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.is_streamed:
+                        chunks = bufferChunks(response.response)
+                        if encoding is not None:
+                            chunks = compressStream(chunks, encoding)
+                        response.response = teeIntoCache(chunks, (key, encoding))
+                    else:
+                        body = response.get_data()
+                        if encoding is not None:
+                            body = compressBody(body, encoding)
+                            response.set_data(body)
+                        pageCache.put((key, encoding), body)
+            
+            response = response or make_response(b"")
+            markEncoding(response, encoding)
+            response.set_etag(etag)
+            lastChange = max(versions[name][1] for name in tableNames)
+            if lastChange: # 0 means it hasnt changed since the server first started tracking it
+                response.last_modified = lastChange
+            response.cache_control.no_cache = True # always check back with us, we answer cheaply
+            if response.is_streamed:
+                return response # make_conditional would read the whole stream to work out its length
+            return response.make_conditional(request)
+        return cached
+    return decorator
+
+
+# --- pagination ---
+
+ENTRIES_PER_PAGE = 50 # default page size for /db/ and /api/entries
+MAX_ENTRIES_PER_PAGE = 500
+
+# escapes the LIKE wildcards so user input is always matched literally
+def escapeLike(userText: str) -> str:
+    return userText.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# cursors are "id:name" of the last row on the previous page
+def makeCursor(entry: Entry) -> str:
+    return f"{entry.id}:{entry.name}"
+
+def readCursor(cursor: str) -> tuple[int, str]:
+    lastId, _, lastName = cursor.partition(":")
+    return int(lastId), lastName
+
+# one page of entries ordered by name, optionally filtered to names starting with q.
+# uses keyset pagination, so every page costs the same no matter how deep into the table it is
+def entryPage(q: str = "", after: str = "", limit: int = ENTRIES_PER_PAGE) -> tuple[list[Entry], str | None]:
+    nameKey = Caseless(Entry.name)
+    query = db.select(Entry).order_by(nameKey, Entry.id).limit(limit + 1)
+    if q:
+        query = query.where(nameKey.like(Caseless(escapeLike(q) + "%"), escape="\\"))
+    if after:
+        lastId, lastName = readCursor(after)
+        query = query.where(nameKey >= Caseless(lastName), or_(nameKey > Caseless(lastName), Entry.id > lastId))
+    data: list[Entry] = db.session.execute(query).scalars().all()
+    # we fetched one extra row to find out if there's another page without a COUNT(*)
+    if len(data) > limit:
+        data = data[:limit]
+        return data, makeCursor(data[-1])
+    return data, None
+
+def entryDict(entry: Entry) -> dict:
+    return {
+        "id": entry.id,
+        "name": entry.name,
+        "locationText": entry.locationText,
+        "locationImg": entry.locationImg,
+        "thumbnail": imageURL(entry.locationImg), # what the page should actually show
+        "available": entry.available,
+        "booked": entry.booked,
+    }
+
+def bookingDict(booking: Booking) -> dict:
+    return {
+        "id": booking.id,
+        "bookedMaterial": booking.bookedMaterial,
+        "bookedBy": booking.bookedBy,
+        "bookInfo": booking.bookInfo,
+    }
+
+def archivedBookingDict(booking: BookingArchive) -> dict:
+    return {
+        "id": booking.id,
+        "bookedMaterial": booking.bookedMaterial,
+        "bookedBy": booking.bookedBy,
+        "bookInfo": booking.bookInfo,
+        "bookedAt": booking.bookedAt,
+        "archivedAt": booking.archivedAt,
+    }
+
+def requestDict(materialRequest: MaterialRequest) -> dict:
+    return {
+        "id": materialRequest.id,
+        "material": materialRequest.material,
+        "requestBy": materialRequest.requestBy,
+        "info": materialRequest.info,
+    }
+
+# what /api/search/<kind> can look through
+# kind : [model, function turning a row into json]
+searchKinds: dict[str, list] = {
+    "entries" : [Entry, entryDict],
+    "bookings" : [Booking, bookingDict],
+    "requests" : [MaterialRequest, requestDict],
+    "archive" : [BookingArchive, archivedBookingDict], # old bookings, see archive.py
+}
+
+
+# --- pages ---
+pages = Blueprint("pages", __name__)
+
+@pages.route("/")
+@pages.route("/index")
+def index():
+    return render_template('index.html')
+
+@pages.route("/db/")
+@cachedPage("entry")
+def lookup():
+    # only the first page is rendered here, the page fetches the rest from /api/entries as you scroll
+    # the counts on it are then kept up to date through /api/availability/stream, starting from seq.
+    # seq is read before the rows (each query sees its own snapshot), so a change in between is sent to the page again instead of lost
+    seq = latestEntryChange()
+    data, nextCursor = entryPage()
+    return stream_template('dbTemplate.html', data=[[entry.name, entry.locationText, imageURL(entry.locationImg), entry.available, entry.booked, entry.id] for entry in data], 
+                           nextCursor=nextCursor, seq=seq)
+
+# GET /api/entries?q=<name prefix>&after=<cursor>&limit=<page size>
+@pages.route("/api/entries")
+def apiEntries():
+    # seq says how fresh the counts are, so the page can ignore live updates older than them. read first, like in lookup
+    seq = latestEntryChange()
+    try:
+        limit = min(max(int(request.args.get("limit", ENTRIES_PER_PAGE)), 1), MAX_ENTRIES_PER_PAGE)
+        data, nextCursor = entryPage(request.args.get("q", ""), request.args.get("after", ""), limit)
+    except ValueError:
+        return jsonify({"error": "invalid limit or cursor"}), 400
+    return jsonify({"entries": [entryDict(entry) for entry in data], "next": nextCursor, "seq": seq})
+
+# GET /api/search/<entries|bookings|requests>?q=<words>&after=<offset>&limit=<page size>
+# ranked full-text search, every word is matched as a prefix
+@pages.route("/api/search/<kind>")
+def apiSearch(kind):
+    if kind not in searchKinds: 
+        return jsonify({"error": f"can't search '{kind}'"}), 404
+    model, toDict = searchKinds[kind]
+    try:
+        limit = min(max(int(request.args.get("limit", ENTRIES_PER_PAGE)), 1), MAX_ENTRIES_PER_PAGE)
+        offset = int(request.args.get("after") or 0)
+    except ValueError:
+        return jsonify({"error": "invalid limit or cursor"}), 400
+    seq = latestEntryChange() if model is Entry else None # before the rows, like in lookup
+    # same trick as entryPage, grab one extra row to see if there's more
+    data = search(model, request.args.get("q", ""), limit + 1, offset)
+    nextCursor = str(offset + limit) if len(data) > limit else None
+    page = {kind: [toDict(row) for row in data[:limit]], "next": nextCursor}
+    if model is Entry:
+        page["seq"] = seq
+    return jsonify(page)
+
+# /db/bookings?history=1 also shows the archived bookings
+@pages.route("/db/bookings")
+@cachedPage("booking", "booking_archive")
+def lookupBookings():
+    history = bool(request.args.get("history"))
+    query = db.select(Booking.bookedMaterial, Booking.bookedBy, Booking.bookInfo)
+    if history:
+        everything = db.union_all(query, db.select(BookingArchive.bookedMaterial, BookingArchive.bookedBy, BookingArchive.bookInfo)).subquery()
+        query = db.select(everything).order_by(everything.c.bookedBy)
+    else:
+        query = query.order_by(Booking.bookedBy)
+    return stream_template('bookingsTemplate.html', data=streamRows(query), history=history)
+
+@pages.route("/book/<name>")
+def booking(name):
+    if request.args:
+        # answers once the booking is committed, see writes.py
+        try:
+            queuedWrite(addBooking, name, request.args["name"], request.args["info"])
+        except TimeoutError as e:
+            return render_template("fail.html", errorText=str(e)), 503
+        # make page to say booking succeeded
+        return redirect("/Success")
+    else:
+        return render_template("bookingTemplate.html", entry=name)
+
+@pages.route("/db/requests")
+@cachedPage("material_request")
+def lookupRequests():
+    data = streamRows(db.select(MaterialRequest.material, MaterialRequest.requestBy, MaterialRequest.info).order_by(MaterialRequest.material))
+    return stream_template('requestsTemplate.html', data=data)
+
+@pages.route("/request")
+def makeRequest():
+    if request.args:
+        try:
+            queuedWrite(addRequest, request.args["material"], request.args["name"], request.args["info"])
+            return redirect("/Success")
+        except TimeoutError as e:
+            return render_template("fail.html", errorText=str(e)), 503
+        except Exception as e:
+            return render_template("fail.html", errorText=e.__repr__())
+    else:
+        return render_template("requestTemplate.html")
+
+@pages.route("/Success")
+def success():
+    return render_template("success.html")
+
+@pages.route("/contributing")
+def contributing():
+    return render_template("contributing.html")
+
+@pages.app_errorhandler(404)
+def pageNotFound(e):
+    return render_template("404.html")
+
+
+# --- app factory ---
+
+# builds the website. the database is connected and brought up to date first. 
+# config is applied before that (over instance/config.toml and CATALOGUE_* environment variables, see configureApp), 
+# e.g. {"SQLALCHEMY_DATABASE_URI": ...} to use another database
+def createApp(config: dict | None = None) -> Flask:
+    app = Flask(__name__)
+    configureApp(app, config)
+    # drops the newline after a {% tag %} and the indentation before it, so loops dont send a blank line per row
+    app.jinja_env.trim_blocks = True
+    app.jinja_env.lstrip_blocks = True
+    initApp(app)
+    initMetrics(app)
+    initWriteQueue(app)
+    initAvailability(app)
+    initImages(app)
+    initCompression(app)
+    initAnalytics(app)
+    app.register_blueprint(pages)
+    return app
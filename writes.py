@@ -0,0 +1,193 @@
+# the website's writes (bookings and requests) go through one writer thread per process instead of each request committing on its own.
+# sqlite only lets one connection write at a time and every commit waits on the disk, so when a whole class books at once
+# the requests used to queue up behind the lock. the writer takes whatever is waiting, writes all of it in one transaction
+# and commits once, then tells every waiting request how its write went.
+# requests still only answer after their write is committed, so nothing changes for whoever is clicking
+from flask import Flask, current_app
+from concurrent.futures import Future, TimeoutError as WaitTimedOut
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+from threading import Lock, Thread
+from typing import Callable
+import atexit
+import logging
+import os
+import queue
+import time
+
+from models import db, Entry, Booking, MaterialRequest, RequestDemand
+
+WRITE_MAX_BATCH = 200 # most writes committed together
+WRITE_MAX_WAIT_MS = 2 # how long the writer waits for more writes to join a batch, this is added to a lone write's time
+WRITE_TIMEOUT = 30 # seconds a request waits for its write before giving up
+WRITE_RETRIES = 3 # times a batch is tried again when the database is locked (by the CLI, another worker, ...) before its writes fail
+WRITE_RETRY_WAIT = 0.2 # seconds before the first retry, doubled each time
+
+logger = logging.getLogger("catalogue.writes")
+
+class QueuedWrite:
+    def __init__(self, work: Callable, args: tuple):
+        self.work = work
+        self.args = args
+        self.future: Future = Future()
+
+class WriteQueue:
+    def __init__(self, app: Flask, maxBatch: int, maxWaitMs: float):
+        self.app = app
+        self.maxBatch = maxBatch
+        self.maxWait = maxWaitMs / 1000
+        self.pending: queue.Queue[QueuedWrite | None] = queue.Queue()
+        self.thread: Thread | None = None
+        self.pid = None
+        self.lock = Lock()
+
+    # runs work(connection, *args) on the writer thread and returns what it returned once it's committed.
+    # if work raises, only its own changes are undone and the exception is raised here instead.
+    # raises TimeoutError if the write takes too long, saying whether it might still be saved
+    def submit(self, work: Callable, *args):
+        self.ensureRunning()
+        write = QueuedWrite(work, args)
+        self.pending.put(write)
+        try:
+            return write.future.result(timeout=WRITE_TIMEOUT)
+        except WaitTimedOut:
+            pass
+        # still waiting in the queue, so it can be taken back out and nothing is saved
+        if write.future.cancel():
+            raise TimeoutError("the server is too busy to save this right now, nothing was saved, please try again")
+        # the writer is already on it, so it will be saved or fail in a moment
+        try:
+            return write.future.result(timeout=WRITE_TIMEOUT)
+        except WaitTimedOut:
+            raise TimeoutError("this is taking a long time to save and might still go through, check before trying again")
+
+    # the thread is started on first use instead of in createApp,
+    # gunicorn forks its workers after the app is built and threads dont survive a fork
+    def ensureRunning(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid(): # another request might have started it while this one waited
+                self.start()
+
+    def start(self):
+        self.pending = queue.Queue() # anything queued before a fork belongs to the parent
+        self.pid = os.getpid()
+        self.thread = Thread(target=self.run, name="catalogue-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    # writes everything still queued, then stops the thread
+    def stop(self):
+        if self.thread is not None and self.pid == os.getpid():
+            self.pending.put(None)
+            self.thread.join(WRITE_TIMEOUT)
+
+    def run(self):
+        with self.app.app_context(), db.engine.connect() as conn:
+            # the writer keeps its connection, and makes commits wait for the disk so an answered write survives a power cut.
+            # that wait now happens once per batch instead of once per click
+            if conn.dialect.name == "sqlite":
+                conn.exec_driver_sql("PRAGMA synchronous = FULL")
+                conn.commit()
+            stopping = False
+            while not stopping:
+                first = self.pending.get()
+                if first is None:
+                    break
+                batch = [first]
+                deadline = time.monotonic() + self.maxWait
+                while len(batch) < self.maxBatch:
+                    try:
+                        write = self.pending.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if write is None:
+                        stopping = True
+                        break
+                    batch.append(write)
+                self.writeBatch(conn, batch)
+            if conn.dialect.name == "sqlite":
+                conn.exec_driver_sql("PRAGMA synchronous = NORMAL") # back to what every other connection uses
+                conn.commit()
+
+    def writeBatch(self, conn, batch: list[QueuedWrite]):
+        # writes whose request gave up waiting are dropped, the rest cant be cancelled from now on
+        batch = [write for write in batch if write.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                results = self.tryBatch(conn, batch)
+                break
+            except Exception as e:
+                if isLocked(e) and attempt < WRITE_RETRIES:
+                    # someone else had the write lock for longer than busy_timeout. nothing was saved, so the whole batch can go again
+                    logger.warning("database locked, trying a batch of %d writes again", len(batch))
+                    time.sleep(WRITE_RETRY_WAIT * 2 ** attempt)
+                    continue
+                # the commit itself failed, nothing in this batch was saved
+                logger.exception("couldn't commit a batch of %d writes", len(batch))
+                for write in batch:
+                    write.future.set_exception(e)
+                return
+        # open pages hear about the new counts straight away (see availability.py)
+        if "availability" in self.app.extensions:
+            self.app.extensions["availability"].poke()
+        for write, result, error in results:
+            if error is None:
+                write.future.set_result(result)
+            else:
+                write.future.set_exception(error)
+
+    # one go at writing and committing the batch, raises if the batch as a whole couldnt be saved
+    def tryBatch(self, conn, batch: list[QueuedWrite]) -> list[tuple]:
+        results = []
+        with conn.begin():
+            if conn.dialect.name == "sqlite":
+                # take the write lock before reading anything. a plain BEGIN only takes it at the first write, and if another
+                # process committed in between sqlite fails straight away instead of waiting out busy_timeout
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+            for write in batch:
+                # each write gets a savepoint, so one bad write (like a duplicate request) doesnt sink the rest
+                try:
+                    with conn.begin_nested():
+                        results.append((write, write.work(conn, *write.args), None))
+                except Exception as e:
+                    if isLocked(e):
+                        raise # not this write's fault, the batch is tried again
+                    results.append((write, None, e))
+        return results
+
+# sqlite's "database is locked" (or "busy"), which goes away if you wait
+def isLocked(error: Exception) -> bool:
+    return isinstance(error, OperationalError) and any(word in str(error.orig) for word in ("locked", "busy"))
+
+# runs a write through the current app's write queue
+def queuedWrite(work: Callable, *args):
+    return current_app.extensions["writeQueue"].submit(work, *args)
+
+# --- the writes ---
+# these run on the writer thread with its connection, so they use plain statements instead of db.session
+
+def addBooking(conn, name: str, bookedBy: str, bookInfo: str) -> int:
+    # the counter is bumped by the database in one statement, so two people booking at once cant lose an update
+    entryId: int = conn.execute(db.update(Entry).where(Entry.name == name).values(booked=Entry.booked + 1).returning(Entry.id)).scalar_one()
+    return conn.execute(db.insert(Booking).values(entryId=entryId, bookedMaterial=name, bookedBy=bookedBy, bookInfo=bookInfo).returning(Booking.id)).scalar_one()
+
+def addRequest(conn, material: str, requestBy: str, info: str) -> int:
+    # one statement instead of looking first, a duplicate name just doesnt insert anything (and doesnt fire the rollup trigger)
+    insert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}[conn.dialect.name](MaterialRequest)
+    added = conn.execute(insert.values(material=material, requestBy=requestBy, info=info)
+                         .on_conflict_do_nothing(index_elements=["material"]).returning(MaterialRequest.id)).scalar()
+    if added is not None:
+        return added
+    # someone already asked for it. instead of failing on the duplicate name, this ask counts towards its demand (see analytics.py)
+    conn.execute(db.update(RequestDemand).where(RequestDemand.material == material).values(asks=RequestDemand.asks + 1, lastAskedAt=int(time.time())))
+    return conn.execute(db.select(MaterialRequest.id).where(MaterialRequest.material == material)).scalar_one()
+
+# sizes can be changed with app.config["WRITE_MAX_BATCH"] and app.config["WRITE_MAX_WAIT_MS"]
+def initWriteQueue(app: Flask):
+    maxBatch = app.config.setdefault("WRITE_MAX_BATCH", WRITE_MAX_BATCH)
+    maxWaitMs = app.config.setdefault("WRITE_MAX_WAIT_MS", WRITE_MAX_WAIT_MS)
+    app.extensions["writeQueue"] = WriteQueue(app, maxBatch, maxWaitMs)